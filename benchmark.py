@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+ExtractorPlus Extraction Benchmark
+----------------------------------
+Compares the native in-process engine against the external command line tools
+for a small-file-heavy archive and a large single-file archive.
+
+Usage: python benchmark.py [--small-files 5000] [--large-mb 512] [--runs 3]
+
+Requirements:
+- Python 3.6+
+- unzip and tar on the PATH for the subprocess numbers
+"""
+
+import argparse
+import importlib.util
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from shutil import which
+
+ROOT = Path(__file__).resolve().parent
+
+
+def load_native():
+    """Load extractorplus/native.py directly, since the package itself needs Deluge to import."""
+    spec = importlib.util.spec_from_file_location('native', str(ROOT / 'extractorplus' / 'native.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_payloads(work, small_files, large_mb):
+    """Create the two source trees that get archived."""
+    small = work / 'small'
+    for i in range(small_files):
+        sub = small / ('dir%03d' % (i % 100))
+        sub.mkdir(parents=True, exist_ok=True)
+        (sub / ('file%05d.txt' % i)).write_bytes(os.urandom(256) + b'x' * 1792)
+    large = work / 'large'
+    large.mkdir()
+    chunk = os.urandom(1024 * 1024)
+    with open(large / 'remux.mkv', 'wb') as f:
+        for _ in range(large_mb):
+            f.write(chunk)
+    return {'small': small, 'large': large}
+
+
+def make_archives(work, payloads):
+    """Build a zip and a tar.gz for each payload."""
+    archives = []
+    for name, src in payloads.items():
+        zpath = work / ('%s.zip' % name)
+        with zipfile.ZipFile(zpath, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+            for path in src.rglob('*'):
+                zf.write(path, path.relative_to(src))
+        archives.append(('.zip', name, zpath))
+        tpath = work / ('%s.tar.gz' % name)
+        with tarfile.open(tpath, 'w:gz', compresslevel=1) as tf:
+            tf.add(str(src), arcname='.')
+        archives.append(('.tar.gz', name, tpath))
+    return archives
+
+
+def run_native(native, archive, dest):
+    return native.NativeExtractor().extract(str(archive), str(dest))
+
+
+def run_subprocess(ext, archive, dest):
+    command = ['unzip', '-qq', '-o'] if ext == '.zip' else ['tar', '-xzf']
+    return subprocess.call(command + [str(archive)], cwd=str(dest), stdout=subprocess.DEVNULL)
+
+
+def time_runs(fn, work, runs):
+    best = None
+    for _ in range(runs):
+        dest = Path(tempfile.mkdtemp(dir=str(work)))
+        start = time.perf_counter()
+        code = fn(dest)
+        elapsed = time.perf_counter() - start
+        shutil.rmtree(str(dest))
+        if code != 0:
+            return None
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--small-files', type=int, default=5000)
+    parser.add_argument('--large-mb', type=int, default=512)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--work-dir', default=None, help='Directory for the generated archives')
+    args = parser.parse_args()
+
+    native = load_native()
+    work = Path(tempfile.mkdtemp(prefix='extplus-bench-', dir=args.work_dir))
+    try:
+        print('Generating payloads in %s...' % work)
+        archives = make_archives(work, make_payloads(work, args.small_files, args.large_mb))
+        print('%-10s %-8s %12s %12s %8s' % ('archive', 'payload', 'native (s)', 'subproc (s)', 'ratio'))
+        for ext, name, archive in archives:
+            native_time = time_runs(lambda d: run_native(native, archive, d), work, args.runs)
+            tool = 'unzip' if ext == '.zip' else 'tar'
+            if which(tool):
+                sub_time = time_runs(lambda d: run_subprocess(ext, archive, d), work, args.runs)
+            else:
+                sub_time = None
+            ratio = '%.2fx' % (sub_time / native_time) if native_time and sub_time else '-'
+            print('%-10s %-8s %12s %12s %8s' % (
+                ext, name,
+                '%.3f' % native_time if native_time is not None else 'failed',
+                '%.3f' % sub_time if sub_time is not None else 'n/a',
+                ratio))
+    finally:
+        shutil.rmtree(str(work), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
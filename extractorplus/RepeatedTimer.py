@@ -2,7 +2,12 @@ from threading import Timer, Lock
 
 
 class RepeatedTimer(object):
-    """Class for creating a timer that executes a function repeatedly at specified intervals."""
+    """
+    Class for creating a timer that executes a function repeatedly at specified intervals.
+
+    If the function returns a positive number, it is used as the delay in seconds before the next call
+    instead of the fixed interval, which lets deadline-driven jobs sleep until they are actually due.
+    """
     
     def __init__(self, interval, function, *args, **kwargs):
         """
@@ -20,6 +25,7 @@ class RepeatedTimer(object):
         self.args = args
         self.kwargs = kwargs
         self.is_running = False
+        self._stopped = False
         self._lock = Lock()
         self.start()
 
@@ -27,14 +33,28 @@ class RepeatedTimer(object):
         """Internal method to run the timer and execute the function."""
         with self._lock:
             self.is_running = False
-            self.start()
-        self.function(*self.args, **self.kwargs)
+        delay = None
+        try:
+            delay = self.function(*self.args, **self.kwargs)
+        finally:
+            with self._lock:
+                stopped = self._stopped
+            if not stopped:
+                self.start(delay)
+
+    def start(self, delay=None):
+        """
+        Start the timer if it's not already running.
 
-    def start(self):
-        """Start the timer if it's not already running."""
+        Args:
+            delay (float): Optional delay before the next call, defaults to the interval
+        """
+        if not isinstance(delay, (int, float)) or delay <= 0:
+            delay = self.interval
         with self._lock:
+            self._stopped = False
             if not self.is_running:
-                self._timer = Timer(self.interval, self._run)
+                self._timer = Timer(delay, self._run)
                 self._timer.daemon = True  # Make timer daemon to exit with main thread
                 self._timer.start()
                 self.is_running = True
@@ -42,6 +62,7 @@ class RepeatedTimer(object):
     def stop(self):
         """Stop the timer."""
         with self._lock:
+            self._stopped = True
             if self._timer is not None:
                 self._timer.cancel()
                 self.is_running = False
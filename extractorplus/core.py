@@ -16,29 +16,52 @@ from __future__ import unicode_literals
 import datetime
 import errno
 import logging
-import ntpath
 import os
+import re
 import shutil
 import subprocess
 import tempfile
 import time
-from concurrent.futures import ThreadPoolExecutor
+import uuid
+import zipfile
+from functools import partial
 from pathlib import Path
-from shutil import which
-from threading import Thread, Lock
+from threading import Lock, Thread
 
 import deluge.component as component
 import deluge.configmanager
-import pkg_resources
-from deluge.common import windows_check
-from deluge.configmanager import ConfigManager
 from deluge.core.rpcserver import export
 from deluge.plugins.pluginbase import CorePluginBase
+from twisted.internet import defer, reactor, task, threads
 
 from extractorplus.RepeatedTimer import RepeatedTimer
+from extractorplus.fileops import changed_since, device_of, finalize_move, walk_files
+from extractorplus.governor import AdaptiveConcurrency, ProcessGovernor
+from extractorplus.jobs import JobControl, JobHandle, new_process_group
+from extractorplus.labels import LabelIndex, parse_label_filter
+from extractorplus.ledger import ExtractionLedger, archive_fingerprint, path_size
+from extractorplus.listing import archive_members, guessed_size, listed_size
+from extractorplus.members import filter_for, member_args, parse_member_filters, write_list_file
+from extractorplus.metrics import ExtractionMetrics, MetricsServer
+from extractorplus.native import NATIVE_EXTENSIONS, NativeExtractor
+from extractorplus.progress import JobProgress, ProgressParser, ProgressTracker, TAR_PROGRESS_ARGS
+from extractorplus.scheduler import ExtractScheduler, QueueFull
+from extractorplus.sniff import ArchiveSniffer
+from extractorplus.space import SpaceReservations
+from extractorplus.streaming import StreamingTracker, completed_files
+from extractorplus.volumes import resolve_sets
+from extractorplus.tools import ToolRegistry
+from extractorplus.verify import sfv_checksums, verify_checksums
 
 log = logging.getLogger(__name__)
 
+# Seconds to wait for further files of a downloading torrent to complete before looking for finished sets
+STREAM_DELAY = 5
+
+# Staging directories are temp_base/<torrent_id>/<job_id>, see extract_archive
+TORRENT_ID_RE = re.compile(r'^[0-9a-f]{40}$')
+JOB_ID_RE = re.compile(r'^[0-9a-f]{12}$')
+
 DEFAULT_PREFS = {'extract_path': '',
                  'extract_in_place': False,
                  'extract_selected_folder': False,
@@ -51,67 +74,33 @@ DEFAULT_PREFS = {'extract_path': '',
                  'auto_cleanup': False,
                  'cleanup_time': 2,
                  'max_extract_threads': 2,
-                 'extracted': []
+                 'native_extensions': [],
+                 'queue_priority': 'age',
+                 'max_extract_per_device': 0,
+                 'device_limits': {},
+                 'metrics_port': 0,
+                 'metrics_address': '127.0.0.1',
+                 'skip_extracted': True,
+                 'fingerprint_partial_hash': False,
+                 'check_free_space': True,
+                 'min_free_space': 1024,
+                 'process_nice': 10,
+                 'io_class': 'best-effort',
+                 'io_level': 7,
+                 'cpu_affinity': '',
+                 'memory_limit': 0,
+                 'adaptive_concurrency': False,
+                 'job_timeout': 0,
+                 'stall_timeout': 0,
+                 'extract_while_downloading': False,
+                 'member_filters': '',
+                 'extract_nested': False,
+                 'nested_max_depth': 2,
+                 'nested_max_ratio': 100,
+                 'nested_max_size': 51200,
+                 'verify_archives': 'off'
                  }
 
-EXTRACTED_FILES = {}
-EXTRACT_COMMANDS = {}
-EXTRA_COMMANDS = {}
-
-if windows_check():
-    egg_path = pkg_resources.resource_filename(__name__, "7z.exe")
-    log.debug("Local path %s" % egg_path)
-    win_7z_exes = [
-        egg_path,
-        '7z.exe',
-        'C:\\Program Files\\7-Zip\\7z.exe',
-        'C:\\Program Files (x86)\\7-Zip\\7z.exe'
-    ]
-
-    ext_7z = ['.r00', '.rar', '.zip', '.tar', '.7z', '.xz', '.lzma']
-    # 7-zip on windows cannot extract tar.* with single command, so we do some pipe magic to one-shot it
-    ext_tar = ['.tar.bz2', '.tbz', '.tar.xz', '.txz', '.tar.gz', '.tgz', '.tar.lzma', '.tlz']
-    for win_7z_exe in win_7z_exes:
-        if which(win_7z_exe):
-            l1_cmds = [win_7z_exe, 'x', '-y', '-aoa']
-            l1t_cmds = [win_7z_exe, 'x', '-y', '-so', '-aoa']
-            l2_cmds = [win_7z_exe, 'x', '-y', '-ttar', '-si', '-aoa']
-            log.debug("Found 7z: %s" % win_7z_exe)
-            cmds = dict.fromkeys(ext_7z, l1_cmds)
-            EXTRACT_COMMANDS = {**cmds, **dict.fromkeys(ext_tar, l1t_cmds)}
-            EXTRA_COMMANDS = dict.fromkeys(ext_tar, l2_cmds)
-            break
-
-else:
-    required_cmds = ['unrar', 'unzip', 'tar', '7zr']
-
-    EXTRACT_COMMANDS = {
-        '.rar': ['unrar', 'x', '-o+', '-y'],
-        '.r00': ['unrar', 'x', '-o+', '-y'],
-        '.tar': ['tar', '-xf'],
-        '.zip': ['unzip'],
-        '.tar.gz': ['tar', '-xzf'],
-        '.tgz': ['tar', '-xzf'],
-        '.tar.bz2': ['tar', '-xjf'],
-        '.tbz': ['tar', '-xjf'],
-        '.tar.lzma': ['tar', '--lzma', '-xf'],
-        '.tlz': ['tar', '--lzma', '-xf'],
-        '.tar.xz': ['tar', '-Jf'],
-        '.txz': ['tar', '--xJf'],
-        '.7z': ['7zr', 'x']
-    }
-    # Test command exists and if not, remove.
-    for command in required_cmds:
-        if not which(command):
-            for k, v in list(EXTRACT_COMMANDS.items()):
-                if command in v[0]:
-                    log.warning('%s not found, disabling support for %s' % (command, k))
-                    del EXTRACT_COMMANDS[k]
-
-if len(EXTRACT_COMMANDS) == 0:
-    raise Exception('No archive extracting programs found, plugin will be disabled.')
-
-
 class Core(CorePluginBase):
     def __init__(self, plugin_name):
         super().__init__(plugin_name)
@@ -121,11 +110,29 @@ class Core(CorePluginBase):
         self.config = deluge.configmanager.ConfigManager(
             'extractorplus.conf', DEFAULT_PREFS
         )
-        self.check_thread = RepeatedTimer(60.0 * 60.0, self.check_cleanup)
-        if self.config['auto_cleanup']:
-            self.check_thread.start()
         self.extract_lock = Lock()
-        self.extract_pool = None
+        self.scheduler = None
+        self.ledger = None
+        self.device_limits = {}
+        self.progress = ProgressTracker()
+        self.jobs = JobControl(self.progress)
+        self.watchdog = None
+        self.recovering = []
+        self.recovery_call = None
+        self.streaming = StreamingTracker()
+        self.stream_calls = {}
+        self.metrics = ExtractionMetrics()
+        self.metrics_server = None
+        self.tools = ToolRegistry(deluge.configmanager.get_config_dir('extractorplus_tools.json'))
+        self.sniffer = ArchiveSniffer()
+        self.label_index = LabelIndex()
+        self.label_list = []
+        self.label_set = frozenset()
+        self.member_filters = {}
+        self.space = SpaceReservations()
+        self.governor = ProcessGovernor()
+        self.adaptive = None
+        self.adaptive_loop = None
 
     def enable(self):
         log.info("ExtractorPlus enabled.")
@@ -148,6 +155,18 @@ class Core(CorePluginBase):
             self.config['extract_path'] = deluge.configmanager.ConfigManager(
                 'core.conf'
             )['download_location']
+
+        # Extracted files are tracked in an indexed ledger rather than the config file
+        self.ledger = ExtractionLedger(deluge.configmanager.get_config_dir('extractorplus.db'))
+        if 'extracted' in self.config:
+            legacy = self.config['extracted']
+            if legacy:
+                log.info("Migrating %s extracted entries from extractorplus.conf" % len(legacy))
+                self.ledger.migrate(legacy)
+            del self.config['extracted']
+            self.config.save()
+        if self.check_thread:
+            self.check_thread.stop()
         self.check_thread = RepeatedTimer(30, self.check_cleanup)
         if self.config['auto_cleanup']:
             log.info("Starting check thread...")
@@ -158,97 +177,335 @@ class Core(CorePluginBase):
             except Exception as q:
                 log.info("Exception stopping check thread: %s" % q)
         
-        # Initialize thread pool for extraction
+        # Initialize the scheduler that feeds extraction jobs to the worker threads
         max_threads = self.config['max_extract_threads']
-        self.extract_pool = ThreadPoolExecutor(max_workers=max_threads)
+        self.update_device_limits()
+        self.update_label_filters()
+        self.label_index.invalidate()
+        self.space.margin = int(self.config['min_free_space']) * 1024 * 1024
+        self.scheduler = ExtractScheduler(
+            lambda eo: self.do_extract(eo, eo.torrent_id), max_workers=max_threads,
+            group=lambda eo: eo.device, group_limit=self.device_limit,
+            admit=self.admit_job, release=lambda eo: self.space.release(eo.job_id)
+        )
         
+        self.start_metrics_server()
+        self.update_governor()
+        if self.watchdog:
+            self.watchdog.stop()
+        self.watchdog = RepeatedTimer(15, self.check_jobs)
+
         component.get('EventManager').register_event_handler(
             'TorrentFinishedEvent', self._on_torrent_finished
         )
+        component.get('EventManager').register_event_handler('TorrentFileCompletedEvent', self._on_file_completed)
+        component.get('EventManager').register_event_handler('TorrentRemovedEvent', self._on_torrent_removed)
+
+        # Jobs the journal still lists were interrupted by a restart. Torrents are loaded after plugins when
+        # the daemon starts, so recovery runs once the session has started, with a final pass as a fallback.
+        self.recovering = self.ledger.unfinished_jobs()
+        component.get('EventManager').register_event_handler('SessionStartedEvent', self.recover_jobs)
+        self.recovery_call = reactor.callLater(30, self.recover_jobs, True)
 
     def disable(self):
         component.get('EventManager').deregister_event_handler(
             'TorrentFinishedEvent', self._on_torrent_finished
         )
+        component.get('EventManager').deregister_event_handler('TorrentFileCompletedEvent', self._on_file_completed)
+        component.get('EventManager').deregister_event_handler('TorrentRemovedEvent', self._on_torrent_removed)
+        component.get('EventManager').deregister_event_handler('SessionStartedEvent', self.recover_jobs)
+        if self.recovery_call and self.recovery_call.active():
+            self.recovery_call.cancel()
+        for call in self.stream_calls.values():
+            if call.active():
+                call.cancel()
+        self.stream_calls = {}
         if self.check_thread:
             try:
                 self.check_thread.stop()
             except Exception as q:
                 log.info("Exception stopping check thread: %s" % q)
                 
-        # Shutdown the thread pool
-        if self.extract_pool:
+        # Shutdown the scheduler
+        if self.scheduler:
             try:
-                self.extract_pool.shutdown(wait=True)
+                self.scheduler.shutdown(wait=True)
             except Exception as e:
-                log.error(f"Error shutting down thread pool: {e}")
+                log.error(f"Error shutting down scheduler: {e}")
+
+        self.stop_metrics_server()
+        self.stop_adaptive()
+        if self.watchdog:
+            self.watchdog.stop()
+
+        if self.ledger:
+            self.ledger.close()
+            self.ledger = None
 
     def update(self):
         pass
 
-    def check_cleanup(self):
-        if not self.config['auto_cleanup']:
+    def recover_jobs(self, final=False):
+        """
+        Resumes or rolls back the jobs a previous daemon run left unfinished. Runs on the reactor.
+
+        Jobs that were moving their output into place are finished off, queued and running jobs are rolled
+        back (their staging directory is removed) and their torrents planned again; the fingerprint cache keeps
+        sets that had completed from being extracted twice. Jobs of torrents that are not loaded yet are kept
+        for a later pass, unless this is the `final` one.
+        """
+        if not self.ledger:
             return
-        now = time.time()
-        cleanup_time = self.config['cleanup_time']
-        new_extracted = []
-        extracted = self.config['extracted']
-        save = False
-        for f in extracted:
-            if os.path.exists(f):
-                file_time = os.path.getmtime(f)
-                file_age = now - file_time
-                if file_age / 3600 >= cleanup_time:
-                    log.info("Auto-deleting %s after %s hour(s)." % (f, cleanup_time))
-                    os.remove(f)
-                    save = True
-                else:
-                    new_extracted.append(f)
+        torrents = component.get('TorrentManager').torrents
+        pending, finalize, rollback = [], [], []
+        for job in self.recovering:
+            if job['torrent_id'] not in torrents and not final:
+                pending.append(job)
+            elif job['state'] == 'finalizing' and job['torrent_id'] in torrents:
+                finalize.append(job)
             else:
-                log.info("File %s no longer exists, removing from tracking." % f)
-                save = True
-        if save:
-            self.config['extracted'] = new_extracted
-            self.config.save()
+                rollback.append(job)
+        self.recovering = pending
+        if final and self.recovery_call and self.recovery_call.active():
+            self.recovery_call.cancel()
+        if finalize or rollback:
+            log.info("Recovering %s interrupted extraction job(s)" % (len(finalize) + len(rollback)))
+            d = threads.deferToThread(self._recover_files, finalize, rollback)
+            d.addCallback(self._on_jobs_recovered, torrents)
+            d.addErrback(lambda failure: log.error("Job recovery failed: %s" % failure.getErrorMessage()))
+        else:
+            d = defer.succeed(None)
+        if final:
+            # Only once recovered jobs are done with their staging directories
+            d.addCallback(lambda _: threads.deferToThread(self.clean_orphaned_staging))
+
+    def _recover_files(self, finalize, rollback):
+        for job in finalize:
+            staging = job['staging']
+            if staging and os.path.isdir(staging):
+                log.info("Finishing the move of %s into %s" % (job['archive'], job['destination']))
+                now = time.time()
+                os.makedirs(job['destination'], exist_ok=True)
+                for name in os.listdir(staging):
+                    dest = os.path.join(job['destination'], name)
+                    try:
+                        dest = finalize_move(os.path.join(staging, name), dest)
+                        os.utime(dest, (now, now))
+                        self.ledger.add(dest, job['torrent_id'], path_size(dest), now)
+                    except OSError as e:
+                        log.error("Failed to move %s: %s" % (name, e))
+                self.ledger.flush()
+                shutil.rmtree(staging, ignore_errors=True)
+        for job in rollback:
+            if job['staging'] and os.path.isdir(job['staging']):
+                log.info("Removing partial output of %s from %s" % (job['archive'], job['staging']))
+                shutil.rmtree(job['staging'], ignore_errors=True)
+            elif job['state'] == 'running':
+                # The destination may be shared with other torrents, so nothing there is removed without knowing
+                # exactly what this job wrote; extracting the set again overwrites it
+                log.info("Leaving partial output of %s in %s" % (job['archive'], job['destination']))
+        self.ledger.journal_done(job['job_id'] for job in finalize + rollback)
+        return finalize, rollback
+
+    def _on_jobs_recovered(self, result, torrents):
+        finalize, rollback = result
+        replan = {job['torrent_id'] for job in rollback if job['torrent_id'] in torrents}
+        for torrent_id in replan:
+            if torrents[torrent_id].get_status(['progress'])['progress'] < 100:
+                # Queued early while downloading, so it is picked up again as more files complete or it finishes
+                self._stream_torrent(torrent_id)
+            else:
+                self._on_torrent_finished(torrent_id)
+        for torrent_id in {job['torrent_id'] for job in finalize} - replan:
+            self.set_torrent_finished(torrent_id)
+
+    def clean_orphaned_staging(self):
+        """
+        Removes job staging directories in the temp dir that no queued or running job owns.
+        """
+        temp_base = self.get_temp_base()
+        try:
+            torrent_dirs = [e for e in os.scandir(temp_base) if e.is_dir() and TORRENT_ID_RE.match(e.name)]
+        except OSError:
+            return
+        for torrent_dir in torrent_dirs:
+            try:
+                job_dirs = [e for e in os.scandir(torrent_dir.path) if e.is_dir() and JOB_ID_RE.match(e.name)]
+            except OSError:
+                continue
+            for job_dir in job_dirs:
+                if self.jobs.get(job_dir.name) is None:
+                    log.info("Removing orphaned staging directory %s" % job_dir.path)
+                    shutil.rmtree(job_dir.path, ignore_errors=True)
+            try:
+                os.rmdir(torrent_dir.path)
+            except OSError:
+                pass
+
+    def check_cleanup(self):
+        """
+        Deletes extracted files whose cleanup deadline has passed.
+
+        Only entries that are actually due are read from the ledger's time index, and the return value tells
+        the timer how long to sleep before the next entry expires.
+        """
+        if not self.config['auto_cleanup'] or not self.ledger:
+            return None
+        cleanup_seconds = float(self.config['cleanup_time']) * 3600
+        while True:
+            due = self.ledger.expired(time.time() - cleanup_seconds)
+            if not due:
+                break
+            for f in due:
+                if os.path.lexists(f):
+                    log.info("Auto-deleting %s after %s hour(s)." % (f, self.config['cleanup_time']))
+                    try:
+                        if os.path.isdir(f) and not os.path.islink(f):
+                            shutil.rmtree(f)
+                        else:
+                            os.remove(f)
+                    except OSError as e:
+                        log.error("Failed to auto-delete %s: %s" % (f, e))
+                else:
+                    log.info("File %s no longer exists, removing from tracking." % f)
+            self.ledger.remove(due)
+
+        oldest = self.ledger.oldest()
+        if oldest is None:
+            # Anything extracted from now on cannot expire sooner than a full cleanup period away
+            return cleanup_seconds
+        return max(oldest + cleanup_seconds - time.time(), 1.0)
 
     def _on_torrent_finished(self, torrent_id):
         """
-        This is called when a torrent finishes and checks if any files to extract.
+        This is called on the reactor when a torrent finishes. It only captures the torrent's status and file
+        list, the planning (labels, archive detection, directories) runs on a thread.
         """
         tid = component.get('TorrentManager').torrents[torrent_id]
         self.EXTRACT_TOTAL = 0
         t_status = tid.get_status([], False, False, True)
-        do_extract = False
+        files = tid.get_files()
         tid.is_finished = False
         tid.update_state()
+        log.info("Processing completed torrent: %s" % t_status['name'])
+        d = threads.deferToThread(self.plan_torrent, torrent_id, t_status, files)
+        d.addErrback(self._on_plan_failed, torrent_id, t_status['name'])
+        return d
+
+    def _on_file_completed(self, torrent_id, index):
+        """
+        Called on the reactor when a file of a downloading torrent completes. Looking for fully downloaded
+        archive sets is delayed a little, so a burst of completed files only plans the torrent once.
+        """
+        if not self.config['extract_while_downloading']:
+            return
+        call = self.stream_calls.get(torrent_id)
+        if call is None or not call.active():
+            self.stream_calls[torrent_id] = reactor.callLater(STREAM_DELAY, self._stream_torrent, torrent_id)
+
+    def _stream_torrent(self, torrent_id):
+        """
+        Queues the archive sets of a downloading torrent that are fully downloaded. Runs on the reactor.
+        """
+        self.stream_calls.pop(torrent_id, None)
+        torrent = component.get('TorrentManager').torrents.get(torrent_id)
+        if torrent is None or not self.config['extract_while_downloading']:
+            return
+        t_status = torrent.get_status([], False, False, True)
+        if t_status['progress'] >= 100:
+            # TorrentFinishedEvent takes over from here
+            return
+        if t_status.get('move_completed'):
+            # The files are moved once the download completes, anything extracted next to them would be left behind
+            log.debug("Not extracting %s while downloading, it is moved on completion" % t_status['name'])
+            return
+        files = completed_files(torrent.get_files(), torrent.get_file_progress())
+        if not files:
+            return
+        d = threads.deferToThread(self.plan_streaming, torrent_id, t_status, files)
+        d.addErrback(lambda failure: log.error("Failed to plan early extraction for %s: %s"
+                                               % (t_status['name'], failure.getErrorMessage())))
+
+    def plan_streaming(self, torrent_id, t_status, files):
+        """
+        Queues the complete archive sets of a still downloading torrent that were not queued yet. Runs on a thread.
+        """
+        to_extract, matched_label = self.plan_archives(torrent_id, t_status, files)
+        claimed = set(self.streaming.claim(torrent_id, [eo.path for eo in to_extract]))
+        to_extract = [eo for eo in to_extract if eo.path in claimed]
+        if not to_extract:
+            return
+        for eo in to_extract:
+            # Deluge is still creating files next to the output, which must not be taken for extracted files
+            eo.staged = True
+        log.info("Extracting %s completed archive set(s) of %s while it downloads"
+                 % (len(to_extract), t_status['name']))
+        self.process_files(to_extract, t_status, torrent_id, t_status['name'], matched_label,
+                           partial(self._on_stream_batch_complete, torrent_id))
+
+    def _on_stream_batch_complete(self, torrent_id):
+        finish = self.streaming.batch_done(torrent_id)
+        if finish is not None:
+            finish()
+
+    def _on_torrent_removed(self, torrent_id):
+        call = self.stream_calls.pop(torrent_id, None)
+        if call is not None and call.active():
+            call.cancel()
+        self.streaming.forget(torrent_id)
+
+    def _on_plan_failed(self, failure, torrent_id, torrent_name):
+        log.error("Failed to plan extraction for %s: %s" % (torrent_name, failure.getErrorMessage()))
+        self.set_torrent_finished(torrent_id)
+
+    def set_torrent_finished(self, torrent_id):
+        """
+        Marks a torrent finished again once its extraction is done. Must run on the reactor thread.
+        """
+        torrent = component.get('TorrentManager').torrents.get(torrent_id)
+        if torrent is not None:
+            torrent.is_finished = True
+            torrent.update_state()
+
+    def plan_torrent(self, torrent_id, t_status, files):
+        """
+        Works out which archives of a finished torrent to extract and where, then queues them. Runs on a thread.
+        """
+        to_extract, matched_label = self.plan_archives(torrent_id, t_status, files)
+        # Sets already queued while the torrent was downloading are not queued again
+        claimed = set(self.streaming.claim(torrent_id, [eo.path for eo in to_extract], early=False))
+        to_extract = [eo for eo in to_extract if eo.path in claimed]
+        if len(to_extract) > 0:
+            self.process_files(to_extract, t_status, torrent_id, t_status['name'], matched_label)
+        else:
+            self._on_batch_complete(torrent_id, t_status['name'])
+
+    def plan_archives(self, torrent_id, t_status, files, create_dirs=True):
+        """
+        Applies the label filter and finds the archive sets of a torrent.
+
+        Returns a list of ExtractObjects (paths still relative to the download location) and the matched label.
+        In-place parent directories are only created when `create_dirs` is set.
+        """
+        do_extract = False
         torrent_name = t_status['name']
-        log.info("Processing completed torrent: %s" % torrent_name)
         # Fetch our torrent's label
         labels = self.get_labels(torrent_id)
         log.debug("Labels collected for %s: %s" % (torrent_name, labels))
         # If we've set a label filter, process it
-        filters = self.config['label_filter'].replace(" ", "")
         matched_label = None
         to_extract = []
-        if filters != "":
+        if self.label_set:
             if len(labels) > 0:
-                # Make the label list once, save needless processing.
-                if "," in self.config['label_filter']:
-                    label_list = filters.split(",")
-                else:
-                    label_list = [filters]
-                log.debug("Filters collected: %s" % label_list)
+                log.debug("Filters collected: %s" % self.label_list)
 
                 # Make sure there's actually a label
                 for label in labels:
-                    if label in label_list:
+                    if label in self.label_set:
                         log.info("Label match (%s), checking %s for archives." % (label, torrent_name))
                         matched_label = label
                         do_extract = True
                         break
-                    # We don't need to keep checking labels if we've found a match
-                    if do_extract:
-                        break
         # Otherwise, we just extract everything
         else:
             log.info("No label filters, extracting: %s" % torrent_name)
@@ -297,20 +554,29 @@ class Core(CorePluginBase):
                 dest = Path(t_status['download_location'])
                 log.info(f"Using in-place extraction with base path: {dest}")
             
-            files = tid.get_files()
+            extract_commands, _ = self.tools.commands()
+            member_filter = filter_for(self.member_filters, labels)
 
-            for f in files:
-                file = f['path']
+            # Volumes are grouped into sets first, so each multi-volume archive is extracted exactly once
+            for vset in resolve_sets(files):
+                file = vset.first
                 file_dest = dest
-                
+
+                kind = self.archive_kind(vset, t_status['download_location'], extract_commands)
+                # If it's not extractable, move on.
+                if kind is None:
+                    continue
+                if vset.multi_volume:
+                    log.debug("Archive set %s has %s volumes (%s bytes)" % (file, len(vset.volumes), vset.size))
+
                 # Override destination to file path if in_place is set
                 if extract_in_place:
                     # For in-place extraction, use the directory containing the archive
-                    parent_dir = os.path.dirname(f['path'])
+                    parent_dir = os.path.dirname(file)
                     f_parent = Path(t_status['download_location']).joinpath(parent_dir)
                     
                     # Make sure the path exists
-                    if not os.path.exists(f_parent):
+                    if create_dirs and not os.path.exists(f_parent):
                         try:
                             os.makedirs(f_parent)
                             log.info(f"Created parent directory for in-place extraction: {f_parent}")
@@ -320,123 +586,464 @@ class Core(CorePluginBase):
                     log.info(f"In-place extraction for {file} to parent directory: {f_parent}")
                     file_dest = f_parent
 
-                file_root, file_ext = os.path.splitext(f['path'])
-                file_ext_sec = os.path.splitext(file_root)[1]
-                if file_ext_sec == ".tar":
-                    file_ext = file_ext_sec + file_ext
-                    file_root = os.path.splitext(file_root)[0]
-                
-                # If it's not extractable, move on.
-                if file_ext not in EXTRACT_COMMANDS:
-                    continue
-
                 if append_archive:
-                    file_name = ntpath.basename(f['path'])
-                    archive_name = os.path.splitext(file_name)[0]
-                    file_dest = Path(file_dest).joinpath(archive_name)
+                    file_dest = Path(file_dest).joinpath(vset.name)
                     log.info(f"Appending archive name: final destination is {file_dest}")
 
-                # Check to prevent double extraction with rar/r00 files
-                if file_ext == '.r00' and any(x['path'] == file_root + '.rar' for x in files):
-                    log.debug('Skipping file with .r00 extension because a matching .rar file exists: %s' % file)
-                    continue
-
-                # Check for RAR archives with PART in the name
-                if file_ext == '.rar' and 'part' in file_root:
-                    part_num = file_root.split('part')[1]
-                    if part_num.isdigit() and int(part_num) != 1:
-                        log.debug('Skipping remaining multi-part rar files: %s' % file)
-                        continue
-                
                 # Make sure the path is properly quoted for logging
-                log.info(f"Creating ExtractObject for {f['path']} with destination: {file_dest}")
-                eo = ExtractObject(f['path'], file_dest)
+                log.info(f"Creating ExtractObject for {file} with destination: {file_dest}")
+                eo = ExtractObject(file, file_dest, torrent_id, kind, vset.size)
+                eo.volumes = len(vset.volumes)
+                eo.volume_paths = vset.paths
+                eo.member_filter = member_filter
                 to_extract.append(eo)
 
-        if len(to_extract) > 0:
-            thread = Thread(target=self.process_files, args=(to_extract, t_status, torrent_id, torrent_name))
-            thread.start()
-        else:
-            tid.is_finished = True
-            tid.update_state()
-            log.info("Processing complete for torrent: %s" % torrent_name)
+        return to_extract, matched_label
+
+    def archive_kind(self, vset, base, extract_commands):
+        """
+        Returns the archive type of a VolumeSet whose paths are relative to `base`, or None if it is not an
+        archive that can be extracted.
+        """
+        file_root, file_ext = os.path.splitext(vset.first)
+        file_ext_sec = os.path.splitext(file_root)[1]
+        if file_ext_sec == ".tar":
+            file_ext = file_ext_sec + file_ext
 
-    """
-    """
+        # Route by what the file actually contains, its name only decides whether to look
+        kind = self.sniffer.kind(Path(base).joinpath(vset.first), file_ext)
+        if kind is None and vset.style == 'zip' and vset.multi_volume and '.7z' in extract_commands:
+            # Spanned zips are opened through their last volume, which unzip cannot do but 7z can
+            kind = '.7z'
+        if kind is None and (file_ext.lower() in extract_commands or file_ext.lower() in NATIVE_EXTENSIONS):
+            # Nothing recognisable in the header, e.g. a bare xz/lzma stream for 7z on Windows or a pre-POSIX tar
+            # without the ustar magic, so go by the name as before
+            kind = file_ext.lower()
+        if kind is None or (kind not in extract_commands and kind not in NATIVE_EXTENSIONS):
+            return None
+        return kind
+
+    def process_files(self, files: list, t_status: dict, torrent_id: str, torrent_name: str,
+                      matched_label: str = None, on_complete=None) -> None:
+        """
+        Resolves the commands for each ExtractObject and queues them as one batch with the scheduler.
+
+        `on_complete` replaces finishing the torrent once the batch has run.
+        """
+        if on_complete is None:
+            on_complete = partial(self._on_batch_complete, torrent_id, torrent_name)
+        extract_objects = self.build_jobs(files, t_status)
+        for file in extract_objects:
+            self.register_job(file)
 
-    def process_files(self, files: list, t_status: object, torrent_id: str, torrent_name: str) -> object:
+        priority = self.job_priority(t_status, matched_label)
+        try:
+            self.scheduler.submit(
+                torrent_id, extract_objects, priority,
+                lambda batch: on_complete()
+            )
+        except (QueueFull, RuntimeError) as e:
+            log.error("Could not queue extraction for %s: %s" % (torrent_name, e))
+            for file in extract_objects:
+                self.jobs.remove(file.job_id)
+                self.progress.finish(file.job_id, -1)
+            self.ledger.journal_done(file.job_id for file in extract_objects)
+            on_complete()
+
+    def build_jobs(self, files: list, t_status: dict) -> list:
+        """
+        Resolves the absolute path, engine, commands and target device of each ExtractObject.
+        """
         extract_objects = []
-        torrent = component.get('TorrentManager').torrents[torrent_id]
+        extract_commands, extra_commands = self.tools.commands()
+        thread_budget = self.decompress_threads()
+        listers = {
+            'unrar': 'unrar' if self.tools.has('unrar') else None,
+            'seven_zip': extract_commands.get('.7z', [None])[0],
+        }
         file: ExtractObject
         for file in files:
             full_command = None
-            file_root, file_ext = os.path.splitext(file.path)
-            file_ext_sec = os.path.splitext(file_root)[1]
-            if file_ext_sec == ".tar":
-                file_ext = file_ext_sec + file_ext
+            file_ext = file.kind
             log.info("Extracting %s" % file.path)
             fpath = os.path.normpath(os.path.join(t_status['download_location'], file.path))
             file.path = fpath
+            file.volume_paths = [os.path.normpath(os.path.join(t_status['download_location'], p))
+                                 for p in file.volume_paths or [file.path]]
+            if self.already_extracted(file):
+                log.info("Skipping %s, it was already extracted to %s" % (file.path, file.destination))
+                continue
+            if file.member_filter and not self.select_members(file, listers):
+                log.info("Skipping %s, none of its files match the member filter" % file.path)
+                continue
+            # Use the in-process engine when selected for this extension, or when no tool can handle it, and
+            # for filtered zips and tarballs, which it filters while reading them instead of listing them first
+            if file_ext in NATIVE_EXTENSIONS and (
+                    file_ext in self.config['native_extensions'] or file_ext not in extract_commands
+                    or file.member_filter):
+                file.native = True
+                extract_objects.append(file)
+                continue
             # Get base commands
-            full_command = EXTRACT_COMMANDS[file_ext].copy()
+            full_command = extract_commands[file_ext].copy()
+            decompressor = self.tools.decompressor(file_ext, thread_budget)
+            if decompressor and '.tar' in extract_commands:
+                # Decompress on several cores and pipe the tar stream into tar
+                file.command1 = decompressor
+                file.command2 = ['tar', '-xf', '-']
+                if self.tools.has('tar', 'gnu'):
+                    file.command2[1:1] = TAR_PROGRESS_ARGS
+                extract_objects.append(file)
+                continue
+            if full_command[0] == 'tar' and self.tools.has('tar', 'gnu'):
+                # Have GNU tar report checkpoints so progress can be followed
+                full_command[1:1] = TAR_PROGRESS_ARGS
             # Append file path
             file.command1 = full_command
             # Check to see if we need two steps for windows/7z
-            if file_ext in EXTRA_COMMANDS:
-                file.command2 = EXTRA_COMMANDS[file_ext].copy()
+            if file_ext in extra_commands:
+                file.command2 = extra_commands[file_ext].copy()
             extract_objects.append(file)
 
-        if len(extract_objects) > 0:
-            use_temp = self.config["use_temp_dir"]
-            futures = []
-            
-            # Submit extraction tasks to the thread pool
-            for ex_obj in extract_objects:
-                futures.append(self.extract_pool.submit(self.do_extract, ex_obj, torrent_id))
-            
-            # Wait for all extractions to complete
-            for future in futures:
-                future.result()  # This will block until the extraction is complete
-                
-            if use_temp:
-                # Use the specified temp directory if available, otherwise use system temp
-                if self.config["temp_dir"] and os.path.isdir(self.config["temp_dir"]):
-                    temp_base = Path(self.config["temp_dir"])
+        # Jobs are throttled per filesystem they write to, which is the temp dir when one is in use
+        use_temp = self.config["use_temp_dir"]
+        listers['xz'] = 'xz' if self.tools.has('xz') else None
+        for file in extract_objects:
+            file.device = device_of(self.get_temp_base() if use_temp or file.staged else file.destination)
+            if not file.size:
+                try:
+                    file.size = os.path.getsize(file.path)
+                except OSError:
+                    file.size = 0
+            if not file.unpacked_size:
+                file.unpacked_size = listed_size(file.path, file.kind, **listers)
+                if file.unpacked_size is None:
+                    file.size_guessed = True
+                    file.unpacked_size = guessed_size(file.path, file.size)
+            file.space_needs = self.space_needs(file)
+        if self.config['check_free_space']:
+            # A job needing more than the whole disk could never be admitted, so it is not queued at all. Guessed
+            # sizes are not trusted that far, those jobs are admitted once they are alone on the disk.
+            fitting = []
+            for file in extract_objects:
+                too_large = None if file.size_guessed else self.space.too_large(file.space_needs)
+                if too_large is None:
+                    fitting.append(file)
                 else:
-                    temp_base = Path(tempfile.gettempdir())
-                ex_dir = temp_base.joinpath(str(torrent_id))
-                if os.path.exists(ex_dir):
-                    try:
-                        os.rmdir(ex_dir)
-                    except OSError as e:
-                        log.warning(f"Could not remove temp directory: {e}")
-        torrent.is_finished = True
-        torrent.update_state()
+                    log.error("Not extracting %s, it needs %s bytes, more than %s holds"
+                              % (file.path, file.unpacked_size, too_large))
+            extract_objects = fitting
+        return extract_objects
+
+    def select_members(self, eo, listers):
+        """
+        Applies a job's member filter to the archive's listing, setting `members` to the files to extract.
+
+        Returns False if no file is wanted. Zips and tarballs are left to the native engine, which filters them
+        as it reads them, and archives that cannot be listed are extracted completely.
+        """
+        if eo.kind in NATIVE_EXTENSIONS:
+            return True
+        members = archive_members(eo.path, eo.kind, **listers)
+        if members is None:
+            log.warning("Could not list %s, extracting all of it despite the member filter" % eo.path)
+            eo.member_filter = None
+            return True
+        wanted = set(eo.member_filter.select(members))
+        if not wanted:
+            return False
+        if len(wanted) < len(members):
+            log.info("Extracting %s of the %s files in %s" % (len(wanted), len(members), eo.path))
+            eo.members = [name for name, _ in members if name in wanted]
+            eo.unpacked_size = sum(size for name, size in members if name in wanted)
+        eo.member_filter = None
+        return True
+
+    def space_needs(self, eo):
+        """
+        Returns device -> (path, bytes) for the space a job needs: the staging directory and, when it is on
+        another filesystem, the destination as well.
+        """
+        needs = {}
+        targets = [str(eo.destination)]
+        if self.config["use_temp_dir"] or eo.staged:
+            targets.insert(0, str(self.get_temp_base()))
+        for path in targets:
+            device = device_of(path)
+            if device is not None and device not in needs:
+                needs[device] = (path, eo.unpacked_size)
+        return needs
+
+    def admit_job(self, eo):
+        """
+        Scheduler admission check, reserving the job's disk space or holding it in the queue until it fits.
+        """
+        if not self.config['check_free_space'] or not eo.space_needs:
+            return True
+        handle = self.jobs.get(eo.job_id)
+        if handle is not None and handle.cancelled:
+            # Let it through so the worker can retire it straight away
+            return True
+        if self.space.admit(eo.job_id, eo.space_needs, eo.size_guessed):
+            return True
+        if not eo.held:
+            eo.held = True
+            log.warning("Holding %s until %s bytes of free space are available" % (eo.path, eo.unpacked_size))
+            progress = self.progress.get(eo.job_id)
+            if progress is not None:
+                progress.state = 'waiting'
+        return False
+
+    def already_extracted(self, eo):
+        """
+        Fingerprints an archive set and returns True if the same set was extracted to the same destination
+        before and everything it produced is still there with the same size.
+        """
+        eo.fingerprint = archive_fingerprint(eo.volume_paths, self.config['fingerprint_partial_hash'])
+        if not self.config['skip_extracted'] or eo.fingerprint is None or not self.ledger:
+            return False
+        recorded = self.ledger.fingerprint(eo.path, os.path.normpath(str(eo.destination)))
+        if recorded is None or recorded[0] != eo.fingerprint or not recorded[1]:
+            return False
+        return all(os.path.lexists(path) and path_size(path) == size for path, size in recorded[1])
+
+    def decompress_threads(self):
+        """
+        Returns how many threads one parallel decompressor may use, sharing the CPUs between the extract workers.
+        """
+        workers = max(1, int(self.config['max_extract_threads']))
+        return max(1, (os.cpu_count() or 1) // workers)
+
+    def job_priority(self, t_status, matched_label):
+        """
+        Returns the scheduler priority for a torrent's jobs, lower values are extracted first.
+        """
+        mode = self.config['queue_priority']
+        if mode == 'size':
+            return t_status.get('total_size', 0), time.time()
+        if mode == 'label':
+            # Labels listed earlier in the label filter win, unmatched torrents go last
+            rank = self.label_list.index(matched_label) if matched_label in self.label_set else len(self.label_list)
+            return rank, time.time()
+        return 0, time.time()
+
+    def get_temp_base(self):
+        """
+        Returns the configured temp directory if it exists, otherwise the system temp directory.
+        """
+        if self.config["temp_dir"] and os.path.isdir(self.config["temp_dir"]):
+            return Path(self.config["temp_dir"])
+        return Path(tempfile.gettempdir())
+
+    def update_device_limits(self):
+        """
+        Maps the configured per-path concurrency limits onto device ids.
+        """
+        limits = {}
+        for path, limit in self.config['device_limits'].items():
+            device = device_of(path)
+            if device is None:
+                log.warning("Ignoring concurrency limit for %s, path is not reachable" % path)
+                continue
+            limits[device] = int(limit)
+        self.device_limits = limits
+
+    def update_label_filters(self):
+        """
+        Parses the label filter and member filter rules once, so matching a finished torrent is a set lookup.
+        """
+        self.label_list = parse_label_filter(self.config['label_filter'])
+        self.label_set = frozenset(self.label_list)
+        self.member_filters = parse_member_filters(self.config['member_filters'])
+
+    def device_limit(self, device):
+        """
+        Returns the number of concurrent extractions allowed on a device, 0 meaning no limit.
+        """
+        if device is None:
+            return 0
+        return self.device_limits.get(device, int(self.config['max_extract_per_device']))
+
+    def _on_batch_complete(self, torrent_id, torrent_name):
+        """
+        Called once every job queued for a torrent has finished, on a worker thread.
+        """
+        if self.streaming.wait(torrent_id, partial(self._on_batch_complete, torrent_id, torrent_name)):
+            log.info("Waiting for the archives of %s extracted while downloading" % torrent_name)
+            return
+        if self.config["use_temp_dir"] or self.config["extract_while_downloading"]:
+            ex_dir = self.get_temp_base().joinpath(str(torrent_id))
+            if os.path.exists(ex_dir):
+                try:
+                    os.rmdir(ex_dir)
+                except OSError as e:
+                    log.warning(f"Could not remove temp directory: {e}")
+        reactor.callFromThread(self.set_torrent_finished, torrent_id)
         log.info("Processing complete for torrent: %s" % torrent_name)
 
+    def register_job(self, eo):
+        """
+        Adds the progress entry and control handle of a job that is about to be queued.
+        """
+        name = os.path.basename(eo.path)
+        self.progress.add(JobProgress(eo.job_id, name, eo.torrent_id, eo.unpacked_size))
+        self.jobs.add(JobHandle(eo.job_id, eo.torrent_id, name))
+        self.ledger.journal(eo.job_id, 'queued', eo.torrent_id, eo.path, eo.destination)
+
     def do_extract(self, to_extract, torrent_id):
         """
+        Runs one extraction job, keeping its progress entry up to date, and returns the exit code.
+
         :param torrent_id:
         :type to_extract: ExtractObject
         """
+        handle = self.jobs.get(to_extract.job_id)
+        if handle is None:
+            handle = JobHandle(to_extract.job_id, torrent_id, os.path.basename(to_extract.path))
+            self.jobs.add(handle)
+        if handle.cancelled:
+            # Cancelled while it was still queued
+            self.jobs.remove(to_extract.job_id)
+            self.progress.finish(to_extract.job_id, -1, 'cancelled')
+            self.ledger.journal_done([to_extract.job_id])
+            return -1
+        progress = self.progress.get(to_extract.job_id)
+        if progress is None:
+            progress = JobProgress(to_extract.job_id, os.path.basename(to_extract.path), torrent_id)
+            self.progress.add(progress)
+        progress.start()
+        exit_code = -1
+        state = None
+        try:
+            problem = self.verify_archive(to_extract, progress, handle)
+            if problem:
+                log.error("Not extracting %s, it is corrupt: %s" % (to_extract.path, problem))
+                state = 'corrupt'
+                return exit_code
+            if handle.cancelled:
+                return exit_code
+            exit_code = self.extract_archive(to_extract, torrent_id, progress, handle)
+            if exit_code == 0 and to_extract.fingerprint and to_extract.manifest:
+                self.ledger.set_fingerprint(to_extract.path, os.path.normpath(str(to_extract.destination)),
+                                            to_extract.fingerprint, torrent_id, to_extract.manifest)
+            if exit_code == 0 and to_extract.manifest and self.config['extract_nested'] \
+                    and to_extract.depth < int(self.config['nested_max_depth']):
+                try:
+                    self.queue_nested(to_extract)
+                except Exception as e:
+                    log.error("Failed to queue the nested archives of %s: %s" % (to_extract.path, e))
+        finally:
+            self.jobs.remove(to_extract.job_id)
+            self.ledger.journal_done([to_extract.job_id])
+            self.progress.finish(to_extract.job_id, exit_code, 'cancelled' if handle.cancelled else state)
+            tool = 'native' if to_extract.native else os.path.basename(to_extract.command1[0])
+            self.metrics.observe_job(
+                tool, exit_code,
+                queue_wait=progress.started_at - progress.queued_at,
+                wall_time=progress.finished_at - progress.started_at,
+                bytes_in=to_extract.size,
+                bytes_out=to_extract.bytes_out,
+                move_time=to_extract.move_time
+            )
+        return exit_code
+
+    def verify_archive(self, to_extract, progress, handle):
+        """
+        Checks an archive set before extracting it, returning what is wrong with it or None.
+
+        Volumes listed in an SFV file next to them are CRC checked on several threads. Without one, volumes from
+        the torrent are trusted, as libtorrent verified their pieces, provided their size on disk still matches;
+        in 'test' mode the extractor's own test command (or zipfile's CRC check) is run instead.
+        """
+        mode = self.config['verify_archives']
+        if mode not in ('sfv', 'test'):
+            return None
+        paths = to_extract.volume_paths or [to_extract.path]
+        try:
+            actual = sum(os.path.getsize(path) for path in paths)
+        except OSError as e:
+            return "missing volume: %s" % e
+        if to_extract.size and actual != to_extract.size:
+            return "volumes hold %s bytes, expected %s" % (actual, to_extract.size)
+        progress.state = 'verifying'
+        try:
+            expected = sfv_checksums(paths)
+            if expected:
+                log.info("Checking %s volume(s) of %s against SFV" % (len(expected), to_extract.path))
+                bad = verify_checksums(expected, self.decompress_threads(), lambda: handle.cancelled)
+                return "%s: %s" % (os.path.basename(bad[0]), bad[1]) if bad else None
+            if mode == 'test':
+                return self.test_archive(to_extract, handle)
+            return None
+        finally:
+            progress.state = 'running'
+
+    def test_archive(self, to_extract, handle):
+        """
+        Runs the extractor's test mode over an archive, returning what failed or None. Compressed tarballs carry
+        no checksums that could be read without decompressing them, so they are not tested.
+        """
+        if to_extract.kind == '.zip':
+            # Whichever engine extracts it, zipfile can check every member's CRC without writing anything
+            try:
+                with zipfile.ZipFile(to_extract.path) as zf:
+                    bad = zf.testzip()
+            except (OSError, zipfile.BadZipFile) as e:
+                return str(e)
+            except (RuntimeError, NotImplementedError) as e:
+                # Encrypted, or a compression method zipfile does not support
+                log.info("Could not test %s: %s" % (to_extract.path, e))
+                return None
+            return "bad CRC for %s" % bad if bad else None
+        if to_extract.native or to_extract.command1 is None:
+            return None
+        tool = to_extract.command1[0]
+        name = os.path.basename(tool).lower()
+        if name.startswith('unrar'):
+            command = [tool, 't', '-p-', to_extract.path]
+        elif '7z' in name:
+            command = [tool, 't', '-p', to_extract.path]
+        else:
+            return None
+        log.info("Testing %s before extracting it" % to_extract.path)
+        limits = dict(self.governor.popen_kwargs(), **new_process_group())
+        try:
+            ps = subprocess.Popen(self.governor.command(command), stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **limits)
+        except OSError as e:
+            log.warning("Could not test %s: %s" % (to_extract.path, e))
+            return None
+        self.governor.apply(ps)
+        handle.attach(ps)
+        ps.wait()
+        if ps.returncode != 0 and not handle.cancelled:
+            return "%s test failed with code %s" % (name, ps.returncode)
+        return None
+
+    def extract_archive(self, to_extract, torrent_id, progress, handle=None):
+        """
+        Extracts a single archive and records what it produced, returning the exit code (-1 on internal errors).
+
+        :type to_extract: ExtractObject
+        :type progress: JobProgress
+        :type handle: JobHandle
+        """
         # Get the absolute path of the configured destination
         destination = str(to_extract.destination)
         log.info(f"Extracting to final destination: {destination}")
         
         # Handle temporary directory for extraction
-        use_temp = self.config["use_temp_dir"]
+        use_temp = self.config["use_temp_dir"] or to_extract.staged
         if use_temp:
-            # Use the specified temp directory if available, otherwise use system temp
-            if self.config["temp_dir"] and os.path.isdir(self.config["temp_dir"]):
-                temp_base = Path(self.config["temp_dir"])
-            else:
-                temp_base = Path(tempfile.gettempdir())
-            ex_dir = temp_base.joinpath(str(torrent_id))
+            # Each job stages into its own directory, so parallel jobs of one torrent never see each other's output
+            ex_dir = self.get_temp_base().joinpath(str(torrent_id), to_extract.job_id)
             log.info(f"Using temporary extraction directory: {ex_dir}")
+            self.ledger.journal(to_extract.job_id, 'running', staging=ex_dir)
         else:
             # If not using temp dir, extract directly to the configured destination
             ex_dir = Path(destination)
             log.info(f"Extracting directly to destination: {ex_dir}")
+            self.ledger.journal(to_extract.job_id, 'running')
             
         # Make sure the extraction directory exists
         try:
@@ -445,36 +1052,38 @@ class Core(CorePluginBase):
                 os.makedirs(ex_dir)
             elif not os.path.isdir(ex_dir):
                 log.error(f"Extraction path exists but is not a directory: {ex_dir}")
-                return
+                return -1
         except Exception as e:
             log.error(f"Failed to create extraction directory: {e}")
-            return
+            return -1
             
         # Store existing files to detect new ones for cleanup tracking
+        started = time.time()
         try:
-            existing_files = os.listdir(ex_dir)
+            existing_files = set(os.listdir(ex_dir))
         except Exception as e:
             log.error(f"Failed to list directory contents: {e}")
-            existing_files = []
+            existing_files = set()
             
         # Prepare extraction command
         try:
-            commands = to_extract.command1
-            commands.append(to_extract.path)
-            if to_extract.command2 is None:
-                log.info('Extracting with command: "%s" to "%s"' % (" ".join(commands), str(ex_dir.name)))
-                ps = subprocess.Popen(to_extract.command1, cwd=ex_dir, stdout=subprocess.PIPE)
-                ps.wait()
+            if to_extract.native:
+                log.info('Extracting natively: "%s" to "%s"' % (to_extract.path, str(ex_dir.name)))
+                extractor = NativeExtractor(progress=lambda name, done: progress.update(bytes_done=done),
+                                            member_filter=to_extract.member_filter)
+                if handle is not None:
+                    handle.attach_extractor(extractor)
+                returncode = extractor.extract(to_extract.path, str(ex_dir))
                 log.info("Extraction complete.")
             else:
-                log.info("Extracting with commands: '%s' and '%s'" % (" ".join(commands), to_extract.command2))
-                ps = subprocess.Popen(to_extract.command1, cwd=ex_dir, stdout=subprocess.PIPE)
-                _ = subprocess.check_output(to_extract.command2, cwd=ex_dir, stdin=ps.stdout)
-                ps.wait()
-            if ps.returncode != 0:
+                returncode = self.run_commands(to_extract, ex_dir, progress, self.governor, handle)
+            if returncode != 0:
                 log.error(
-                    'Extract failed for %s with code %s' % (ex_dir, ps.returncode)
+                    'Extract failed for %s with code %s' % (ex_dir, returncode)
                 )
+                if use_temp:
+                    # The staging directory only holds this job's partial output
+                    shutil.rmtree(str(ex_dir), ignore_errors=True)
             else:
                 now = datetime.datetime.now().timestamp()
                 
@@ -492,77 +1101,204 @@ class Core(CorePluginBase):
                         except OSError as ex:
                             if not (ex.errno == errno.EEXIST and os.path.isdir(destination)):
                                 log.error(f"Error creating destination folder: {ex}")
-                                return
+                                return -1
                         
                         log.info(f"Moving files from temp {ex_dir} to final destination {destination}")
-                        extracted = self.config['extracted']
+                        # From here on a restart finishes the move instead of extracting again
+                        self.ledger.journal(to_extract.job_id, 'finalizing')
+                        move_start = time.time()
                         for f in allfiles:
                             src = ex_dir.joinpath(f)
                             dest = Path(destination).joinpath(f)
-                            temp_dest = f"{dest}.extplus"
-                            log.info(f"Moving {src} to {dest} (via temp {temp_dest})")
+                            log.info(f"Moving {src} to {dest}")
                             try:
-                                shutil.move(str(src), temp_dest)
-                                log.info(f"Renaming {temp_dest} to {dest}")
-                                shutil.move(temp_dest, str(dest))
+                                # A plain rename on the same filesystem, one streamed copy otherwise
+                                dest = finalize_move(str(src), str(dest))
                                 os.utime(str(dest), (now, now))
-                                extracted.append(str(dest))
+                                self.track_extracted(to_extract, dest, now)
                             except Exception as move_error:
                                 log.error(f"Failed to move/rename file: {move_error}")
-                                # If rename failed but temp file exists, try to recover
-                                if os.path.exists(temp_dest):
-                                    try:
-                                        shutil.move(temp_dest, str(dest))
-                                        log.info(f"Recovered from rename failure for {temp_dest}")
-                                        os.utime(str(dest), (now, now))
-                                        extracted.append(str(dest))
-                                    except Exception as recovery_error:
-                                        log.error(f"Recovery attempt failed: {recovery_error}")
-                        self.config['extracted'] = extracted
-                        self.config.save()
+                        to_extract.move_time = time.time() - move_start
+                        self.ledger.flush()
+                        try:
+                            os.rmdir(ex_dir)
+                        except OSError as e:
+                            log.warning(f"Leaving staging directory {ex_dir} with unmoved files: {e}")
                     except OSError as e:
                         log.error(f"Error: {ex_dir} : {e}")
                 else:
                     # Simply track the new files created by extraction
-                    extracted = self.config['extracted']
                     new_files = os.listdir(ex_dir)
                     for new_file in new_files:
+                        dest = Path(ex_dir).joinpath(new_file)
                         if new_file not in existing_files:
-                            dest = Path(ex_dir).joinpath(new_file)
                             os.utime(dest, (now, now))
-                            extracted.append(str(dest))
-                    self.config['extracted'] = extracted
-                    self.config.save()
+                            self.track_extracted(to_extract, dest, now)
+                        elif changed_since(str(dest), started):
+                            # Overwritten output from an earlier run still belongs to this set's fingerprint
+                            to_extract.manifest.append((str(dest), path_size(str(dest))))
+                    self.ledger.flush()
+            return returncode
         except Exception as e:
             log.error(f"Extract Exception: {e}")
+            return -1
+
+    def queue_nested(self, parent):
+        """
+        Queues the archives found in a finished job's output as follow-up jobs for the same torrent. Runs on the
+        worker thread that extracted `parent`, before its batch completes, so the torrent is only marked finished
+        once the nested jobs are done too.
+
+        Archives that would expand more than `nested_max_ratio` times, or push the total extracted from one
+        top-level archive's nested archives past `nested_max_size` MB, are left alone.
+        """
+        root = parent.root or parent
+        extract_commands, _ = self.tools.commands()
+        max_ratio = float(self.config['nested_max_ratio'] or 0)
+        max_size = int(self.config['nested_max_size'] or 0) * 1024 * 1024
+        nested = []
+        for vset in resolve_sets(walk_files(path for path, _ in parent.manifest)):
+            kind = self.archive_kind(vset, '', extract_commands)
+            if kind is None:
+                continue
+            # Nested archives are extracted where they are
+            destination = os.path.dirname(vset.first)
+            if self.config['append_archive_name']:
+                destination = os.path.join(destination, vset.name)
+            eo = ExtractObject(vset.first, destination, parent.torrent_id, kind, vset.size)
+            eo.volumes = len(vset.volumes)
+            eo.volume_paths = vset.paths
+            eo.depth = parent.depth + 1
+            eo.root = root
+            eo.staged = parent.staged
+            nested.append(eo)
+        if not nested:
+            return
+
+        jobs = []
+        # Paths are absolute already, so there is no download location to resolve them against
+        for eo in self.build_jobs(nested, {'download_location': ''}):
+            if max_ratio and eo.size and eo.unpacked_size > eo.size * max_ratio:
+                log.warning("Not extracting nested archive %s, it would expand %.0f times"
+                            % (eo.path, eo.unpacked_size / eo.size))
+                continue
+            with self.extract_lock:
+                if max_size and root.nested_bytes + eo.unpacked_size > max_size:
+                    log.warning("Not extracting nested archive %s, the nested archives of %s would exceed %s MB"
+                                % (eo.path, root.path, self.config['nested_max_size']))
+                    continue
+                root.nested_bytes += eo.unpacked_size
+            jobs.append(eo)
+        claimed = set(self.streaming.claim(parent.torrent_id, [eo.path for eo in jobs]))
+        jobs = [eo for eo in jobs if eo.path in claimed]
+        if not jobs:
+            return
+
+        log.info("Queueing %s nested archive(s) found in %s" % (len(jobs), parent.path))
+        for eo in jobs:
+            self.register_job(eo)
+        on_complete = partial(self._on_stream_batch_complete, parent.torrent_id)
+        try:
+            # Ahead of other torrents, as this one is waiting for them to finish
+            self.scheduler.submit(parent.torrent_id, jobs, (-1, time.time()), lambda batch: on_complete())
+        except (QueueFull, RuntimeError) as e:
+            log.error("Could not queue nested archives of %s: %s" % (parent.path, e))
+            for eo in jobs:
+                self.jobs.remove(eo.job_id)
+                self.progress.finish(eo.job_id, -1)
+            self.ledger.journal_done(eo.job_id for eo in jobs)
+            on_complete()
+
+    def track_extracted(self, to_extract, path, extracted_at):
+        """
+        Records a produced top-level file or directory in the ledger and the job's output size.
+        """
+        size = path_size(str(path))
+        to_extract.bytes_out += size
+        to_extract.manifest.append((str(path), size))
+        self.ledger.add(str(path), to_extract.torrent_id, size, extracted_at)
 
     @staticmethod
-    def get_labels(torrent_id):
+    def run_commands(to_extract, ex_dir, progress, governor=None, handle=None):
         """
-         Asking the system about the labels isn't very cool, so try this instead
+        Runs the external extraction command(s) for an ExtractObject and returns the exit code.
+
+        The tool's progress output is read as it is produced and parsed into `progress`, and `governor` applies
+        the configured process priorities and limits. Each process gets its own process group and is attached
+        to `handle`, so a cancelled job takes anything the tool spawned down with it.
         """
-        labels = []
-        label_config = ConfigManager('label.conf', defaults=False)
-        if 'torrent_labels' in label_config:
-            log.debug("We have a Label config.")
-            if torrent_id in label_config['torrent_labels']:
-                labels.append(label_config['torrent_labels'][torrent_id])
+        governor = governor or ProcessGovernor()
+        handle = handle or JobHandle(to_extract.job_id, to_extract.torrent_id, os.path.basename(to_extract.path))
+        commands = to_extract.command1
+        commands.append(to_extract.path)
+        list_file = None
+        if to_extract.members:
+            # Names go through a list file, there can be more of them than fit on a command line
+            list_file = write_list_file(to_extract.members)
+            switches, names = member_args(commands[0], list_file)
+            commands[-1:-1] = switches
+            commands.extend(names)
+        try:
+            return Core._run_commands(to_extract, ex_dir, progress, governor, handle)
+        finally:
+            if list_file:
+                try:
+                    os.remove(list_file)
+                except OSError:
+                    pass
 
-        label_plus_config = ConfigManager('labelplus.conf', defaults=False)
-        if 'mappings' in label_plus_config:
-            log.debug("We have a label plus config.")
-            if torrent_id in label_plus_config['mappings']:
-                mapping = label_plus_config['mappings'][torrent_id]
-                labels.append(label_plus_config['labels'][mapping]['name'])
+    @staticmethod
+    def _run_commands(to_extract, ex_dir, progress, governor, handle):
+        commands = to_extract.command1
+        parser = ProgressParser(progress)
+        limits = dict(governor.popen_kwargs(), **new_process_group())
+        if to_extract.command2 is None:
+            log.info('Extracting with command: "%s" to "%s"' % (" ".join(commands), str(ex_dir.name)))
+            # No stdin, so a tool asking for a password fails instead of waiting forever
+            ps = subprocess.Popen(governor.command(to_extract.command1), cwd=ex_dir, stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **limits)
+            governor.apply(ps)
+            handle.attach(ps)
+            parser.drain(ps.stdout)
+            ps.wait()
+            log.info("Extraction complete.")
+            return ps.returncode
+        log.info("Extracting with commands: '%s' and '%s'" % (" ".join(commands), to_extract.command2))
+        # The first command streams data to the second, so progress comes from both stderr streams
+        # (7z -bsp2 on Windows, tar checkpoints behind a parallel decompressor on Linux)
+        ps = subprocess.Popen(governor.command(to_extract.command1), cwd=ex_dir, stdin=subprocess.DEVNULL,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, **limits)
+        governor.apply(ps)
+        handle.attach(ps)
+        ps2 = subprocess.Popen(governor.command(to_extract.command2), cwd=ex_dir, stdin=ps.stdout,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **limits)
+        governor.apply(ps2)
+        handle.attach(ps2)
+        ps.stdout.close()
+        reader = Thread(target=ProgressParser(progress).drain, args=(ps2.stderr,), name='ExtractorPlus-progress')
+        reader.daemon = True
+        reader.start()
+        parser.drain(ps.stderr)
+        ps2.wait()
+        ps.wait()
+        reader.join()
+        return ps.returncode or ps2.returncode
 
-        return labels
+    def get_labels(self, torrent_id):
+        """
+         Asking the system about the labels isn't very cool, so look them up in our cached index instead
+        """
+        return self.label_index.labels(torrent_id)
 
     @export
     def set_config(self, config):
         """Sets the config dictionary."""
         auto_clean = self.config['auto_cleanup']
+        cleanup_time = self.config['cleanup_time']
         max_threads = self.config['max_extract_threads']
-        
+        metrics_port = self.config['metrics_port']
+        metrics_address = self.config['metrics_address']
+
         for key in config:
             self.config[key] = config[key]
             
@@ -572,16 +1308,150 @@ class Core(CorePluginBase):
                 self.check_thread.start()
             else:
                 self.check_thread.stop()
-                
-        # Update thread pool if max_threads changed
-        if max_threads != self.config['max_extract_threads']:
-            # Shutdown existing pool and create a new one with updated thread count
-            if self.extract_pool:
-                self.extract_pool.shutdown(wait=False)
-            self.extract_pool = ThreadPoolExecutor(max_workers=self.config['max_extract_threads'])
+        elif auto_clean and cleanup_time != self.config['cleanup_time']:
+            # The sleep was computed from the old cleanup time, so re-check soon with the new one
+            self.check_thread.stop()
+            self.check_thread.start()
+
+        self.update_device_limits()
+        self.update_label_filters()
+        self.space.margin = int(self.config['min_free_space']) * 1024 * 1024
+
+        if (metrics_port, metrics_address) != (self.config['metrics_port'], self.config['metrics_address']):
+            self.stop_metrics_server()
+            self.start_metrics_server()
+
+        # Resize the worker pool if max_threads changed, queued jobs are kept
+        if max_threads != self.config['max_extract_threads'] and self.scheduler:
+            self.scheduler.set_max_workers(self.config['max_extract_threads'])
+        self.update_governor()
             
         self.config.save()
 
+    @export
+    def get_progress(self):
+        """Returns the progress of queued, running and recently finished extraction jobs."""
+        return self.progress.snapshot()
+
+    def check_jobs(self):
+        """
+        Watchdog stopping jobs that ran past the configured wall-clock or no-progress timeout.
+        """
+        self.jobs.check_timeouts(float(self.config['job_timeout'] or 0) * 60,
+                                 float(self.config['stall_timeout'] or 0) * 60)
+
+    def update_governor(self):
+        """
+        Applies the extractor process limits and starts or stops adaptive concurrency.
+        """
+        self.governor = ProcessGovernor(
+            self.config['process_nice'], self.config['io_class'], self.config['io_level'],
+            self.config['cpu_affinity'], self.config['memory_limit']
+        )
+        self.stop_adaptive()
+        if self.config['adaptive_concurrency'] and self.scheduler:
+            self.adaptive = AdaptiveConcurrency(self.config['max_extract_threads'])
+            self.adaptive_loop = task.LoopingCall(self.adapt_concurrency)
+            self.adaptive_loop.start(10, now=False)
+
+    def stop_adaptive(self):
+        if self.adaptive_loop and self.adaptive_loop.running:
+            self.adaptive_loop.stop()
+        self.adaptive_loop = None
+        if self.adaptive and self.scheduler:
+            # Give back any workers taken away while seeding was degraded
+            self.scheduler.set_max_workers(self.config['max_extract_threads'])
+        self.adaptive = None
+
+    def adapt_concurrency(self):
+        """
+        Samples Deluge's upload rate and disk queue on the reactor and resizes the worker pool accordingly.
+        """
+        try:
+            status = component.get('Core').get_session_status(['payload_upload_rate', 'disk.queued_disk_jobs'])
+        except Exception as e:
+            log.debug("Could not read session status: %s" % e)
+            return
+        workers = self.adaptive.update(
+            status.get('payload_upload_rate', 0), status.get('disk.queued_disk_jobs', 0), self.scheduler.active
+        )
+        if workers != self.scheduler.max_workers:
+            self.scheduler.set_max_workers(workers)
+
+    def start_metrics_server(self):
+        """
+        Starts the /metrics HTTP endpoint if a port is configured.
+        """
+        port = int(self.config['metrics_port'] or 0)
+        if not port:
+            return
+        try:
+            self.metrics_server = MetricsServer(
+                lambda: self.metrics.render(self.gauges()), self.config['metrics_address'], port
+            )
+            self.metrics_server.start()
+        except OSError as e:
+            log.error("Could not start metrics endpoint on port %s: %s" % (port, e))
+            self.metrics_server = None
+
+    def stop_metrics_server(self):
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+
+    def gauges(self):
+        """
+        Returns point-in-time values reported alongside the job metrics.
+        """
+        return {
+            'extractorplus_queued_jobs': self.scheduler.queued() if self.scheduler else 0,
+            'extractorplus_running_jobs': self.scheduler.active if self.scheduler else 0,
+            'extractorplus_max_workers': self.scheduler.max_workers if self.scheduler else 0,
+            'extractorplus_tracked_files': len(self.ledger) if self.ledger else 0,
+            'extractorplus_reserved_bytes': sum(self.space.reserved().values()),
+        }
+
+    @export
+    def list_jobs(self):
+        """Returns the queued and running extraction jobs, with the pids of their extractor processes."""
+        return self.jobs.list()
+
+    @export
+    def cancel_job(self, job_id):
+        """Cancels a queued or running extraction job. Returns False if the job is unknown or already done."""
+        return self.jobs.cancel(job_id, 'cancelled by user')
+
+    @export
+    def get_stats(self):
+        """Returns the extraction counters and histograms along with current queue gauges."""
+        stats = self.metrics.to_dict()
+        stats.update(self.gauges())
+        return stats
+
+    @export
+    def get_tools(self):
+        """Returns the discovered extraction tools with their versions and detected features."""
+        return self.tools.summary()
+
+    @export
+    def refresh_tools(self):
+        """Probes the extraction tools again, e.g. after installing or upgrading one."""
+        self.tools.refresh()
+        log.info("Extraction tools refreshed: %s" % ", ".join(sorted(self.tools.tools)))
+        return self.tools.summary()
+
+    @export
+    def invalidate_extracted(self, torrent_ids=None):
+        """
+        Forgets which archive sets were already extracted, for the given torrents or all of them, so the next
+        (forced) extraction runs them again. Returns the number of forgotten sets.
+        """
+        if not self.ledger:
+            return 0
+        count = self.ledger.invalidate_fingerprints(torrent_ids)
+        log.info("Forgot %s extracted archive fingerprint(s)" % count)
+        return count
+
     @export
     def get_config(self):
         """Returns the config dictionary."""
@@ -635,9 +1505,133 @@ class Core(CorePluginBase):
             return False
 
 
+    @export
+    def force_extract_many(self, torrent_ids, dry_run=False):
+        """
+        Plans the extraction of several completed torrents in one pass and queues them as a single batch.
+
+        Archives shared by several torrents are only extracted once per destination. With `dry_run` nothing is
+        extracted, the plan is just returned.
+
+        Returns:
+            Deferred: fires with a list of {'torrent_id', 'name', 'archives'} dicts, each archive being a dict
+            of 'path', 'kind', 'engine', 'destination', 'size', 'unpacked_size' and 'volumes'
+        """
+        torrents = component.get('TorrentManager').torrents
+        captured = []
+        for torrent_id in torrent_ids:
+            torrent = torrents.get(torrent_id)
+            if torrent is None:
+                log.error("Torrent ID %s not found.", torrent_id)
+                continue
+            t_status = torrent.get_status([], False, False, True)
+            if t_status['progress'] < 100:
+                log.warning("Torrent %s is not completed yet (%.2f%%), skipping force extraction",
+                            t_status['name'], t_status['progress'])
+                continue
+            captured.append((torrent_id, t_status, torrent.get_files()))
+            if not dry_run:
+                torrent.is_finished = False
+                torrent.update_state()
+        log.info("Force extraction%s requested for %s torrent(s)" % (" dry run" if dry_run else "", len(captured)))
+        d = threads.deferToThread(self._force_extract_many, captured, dry_run)
+        if not dry_run:
+            d.addErrback(self._on_force_failed, [torrent_id for torrent_id, _, _ in captured])
+        return d
+
+    def _on_force_failed(self, failure, torrent_ids):
+        log.error("Force extraction failed: %s" % failure.getErrorMessage())
+        for torrent_id in torrent_ids:
+            self.set_torrent_finished(torrent_id)
+        return failure
+
+    def _force_extract_many(self, captured, dry_run):
+        plan = []
+        jobs = []
+        seen = set()
+        queued = {}
+        for torrent_id, t_status, files in captured:
+            to_extract, _ = self.plan_archives(torrent_id, t_status, files, create_dirs=not dry_run)
+            archives = []
+            for eo in self.build_jobs(to_extract, t_status):
+                key = (eo.path, os.path.normpath(str(eo.destination)))
+                if key in seen:
+                    log.debug("%s is already planned for %s, skipping duplicate" % key)
+                    continue
+                seen.add(key)
+                archives.append({
+                    'path': eo.path,
+                    'kind': eo.kind,
+                    'engine': 'native' if eo.native else os.path.basename(eo.command1[0]),
+                    'destination': str(eo.destination),
+                    'size': eo.size,
+                    'unpacked_size': eo.unpacked_size,
+                    'volumes': eo.volumes,
+                    # Files selected by the member filter, None when the whole archive is extracted
+                    'members': eo.members,
+                })
+                jobs.append(eo)
+            plan.append({'torrent_id': torrent_id, 'name': t_status['name'], 'archives': archives})
+            if dry_run:
+                continue
+            if archives:
+                queued[torrent_id] = t_status['name']
+            else:
+                reactor.callFromThread(self.set_torrent_finished, torrent_id)
+        if dry_run or not jobs:
+            return plan
+
+        def on_complete(batch):
+            for tid, name in queued.items():
+                self._on_batch_complete(tid, name)
+
+        for eo in jobs:
+            self.register_job(eo)
+        try:
+            # Explicitly requested work goes ahead of everything queued automatically
+            self.scheduler.submit('force', jobs, (-1, time.time()), on_complete)
+        except (QueueFull, RuntimeError) as e:
+            log.error("Could not queue forced extraction: %s" % e)
+            for eo in jobs:
+                self.jobs.remove(eo.job_id)
+                self.progress.finish(eo.job_id, -1)
+            self.ledger.journal_done(eo.job_id for eo in jobs)
+            on_complete(None)
+        return plan
+
+
 class ExtractObject:
-    def __init__(self, path, destination):
+    def __init__(self, path, destination, torrent_id=None, kind=None, size=0):
         self.path = path
         self.destination = destination
+        self.torrent_id = torrent_id
+        # Archive type as detected from the file's contents, e.g. '.rar' for a .cbr
+        self.kind = kind
+        # Combined size of all the archive's volumes
+        self.size = size
+        self.volumes = 1
+        # Extracted size, whether it is only guessed, and the space the job needs per device, see Core.space_needs
+        self.unpacked_size = 0
+        self.size_guessed = False
+        self.space_needs = {}
+        self.held = False
+        self.device = None
+        # Extracted through a staging directory even without use_temp_dir, as for torrents still downloading
+        self.staged = False
+        self.job_id = uuid.uuid4().hex[:12]
+        self.bytes_out = 0
+        self.move_time = None
+        # Final paths and sizes of the top-level files and directories this job produced
+        self.manifest = []
+        self.volume_paths = None
+        self.fingerprint = None
         self.command1 = None
         self.command2 = None
+        self.native = False
+        # Member filter still to apply while extracting, or the member names selected with it up front
+        self.member_filter = None
+        self.members = None
+        # Nesting level, the top-level job a nested archive came from and the bytes its nested jobs may produce
+        self.depth = 0
+        self.root = None
+        self.nested_bytes = 0
@@ -329,6 +329,387 @@ Deluge.ux.preferences.ExtractorPlusPage = Ext.extend(Ext.Panel, {
             width: '97%'
         });
 
+        this.memberSet = this.form.add({
+            xtype: 'fieldset',
+            border: false,
+            title: _('Member Filters'),
+            autoHeight: true,
+            labelAlign: 'top',
+            labelWidth: 80,
+            style: 'margin-top: 3px; margin-bottom: 0px; padding-bottom: 0px;'
+        });
+
+        this.memberFilters = this.memberSet.add({
+            xtype: 'textarea',
+            fieldLabel: _('(label | include | exclude | min MB, e.g. * | | *sample*, *.nfo | 1)'),
+            name: 'member_filters',
+            labelSeparator: '',
+            width: '97%',
+            height: 80,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Only extract the files of an archive that match a rule. One rule per line: label | include globs | ' +
+                            'exclude globs | minimum size in MB. Globs are comma-separated, use * as the label for torrents ' +
+                            'without a rule of their own.'
+                    });
+                }
+            }
+        });
+
+        this.performanceSet = this.form.add({
+            xtype: 'fieldset',
+            border: false,
+            title: _('Performance'),
+            autoHeight: true,
+            labelAlign: 'top',
+            labelWidth: 80,
+            defaultType: 'textfield',
+            style: 'margin-top: 3px; margin-bottom: 0px; padding-bottom: 0px;'
+        });
+
+        this.nativeExtensions = this.performanceSet.add({
+            fieldLabel: _('Native Engine Extensions:'),
+            name: 'native_extensions',
+            labelSeparator: '',
+            width: '97%',
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Comma-separated extensions (e.g. .zip, .tar.gz) to extract in-process instead of with an external tool. ' +
+                            'Zip and tar archives always use the native engine when no tool is installed.'
+                    });
+                }
+            }
+        });
+
+        this.queuePriority = this.performanceSet.add({
+            xtype: 'combo',
+            fieldLabel: _('Queue Order:'),
+            name: 'queue_priority',
+            labelSeparator: '',
+            mode: 'local',
+            store: [
+                ['age', _('Oldest first')],
+                ['size', _('Smallest torrent first')],
+                ['label', _('Label filter order')]
+            ],
+            triggerAction: 'all',
+            editable: false,
+            forceSelection: true,
+            value: 'age',
+            width: 200,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Which queued torrents are extracted first when more archives are waiting than there are extraction slots.'
+                    });
+                }
+            }
+        });
+
+        this.maxPerDevice = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Max Per Disk:'),
+            name: 'max_extract_per_device',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 32,
+            value: 0,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Maximum number of extractions writing to the same disk at once. 0 means only the global limit applies.'
+                    });
+                }
+            }
+        });
+
+        this.deviceLimits = this.performanceSet.add({
+            fieldLabel: _('Per-Path Limits:'),
+            name: 'device_limits',
+            labelSeparator: '',
+            width: '97%',
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Comma-separated path=limit overrides, e.g. /mnt/nvme=4, /mnt/array=1. ' +
+                            'The limit applies to the whole disk the path is on.'
+                    });
+                }
+            }
+        });
+
+        this.metricsPort = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Metrics Port:'),
+            name: 'metrics_port',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 65535,
+            value: 0,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Serve extraction metrics in Prometheus format at http://127.0.0.1:PORT/metrics. 0 disables the endpoint.'
+                    });
+                }
+            }
+        });
+
+        this.processNice = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Extractor Niceness:'),
+            name: 'process_nice',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 19,
+            value: 10,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'CPU priority of extraction processes, from 0 (normal) to 19 (lowest). Higher values leave more CPU to Deluge.'
+                    });
+                }
+            }
+        });
+
+        this.ioClass = this.performanceSet.add({
+            xtype: 'combo',
+            fieldLabel: _('Extractor IO Priority:'),
+            name: 'io_class',
+            labelSeparator: '',
+            mode: 'local',
+            store: [
+                ['none', _('Unchanged')],
+                ['best-effort', _('Best effort (lowest)')],
+                ['idle', _('Idle')]
+            ],
+            triggerAction: 'all',
+            editable: false,
+            forceSelection: true,
+            value: 'best-effort',
+            width: 200,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Disk priority of extraction processes (Linux, needs ionice). Idle only uses the disk when nothing else does.'
+                    });
+                }
+            }
+        });
+
+        this.cpuAffinity = this.performanceSet.add({
+            fieldLabel: _('Extractor CPUs:'),
+            name: 'cpu_affinity',
+            labelSeparator: '',
+            width: '97%',
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Optional list of CPUs extraction processes may run on, e.g. 2,3 or 2-5. Leave empty to use all CPUs.'
+                    });
+                }
+            }
+        });
+
+        this.memoryLimit = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Memory Limit (MB):'),
+            name: 'memory_limit',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 1048576,
+            value: 0,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Maximum address space of each extraction process in MB, 0 for no limit.'
+                    });
+                }
+            }
+        });
+
+        this.adaptiveConcurrency = this.performanceSet.add({
+            xtype: 'checkbox',
+            labelStyle: 'display: none',
+            boxLabel: _('Reduce concurrent extractions while seeding suffers'),
+            name: 'adaptive_concurrency',
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Temporarily runs fewer extractions at once when the upload rate drops or the disk queue grows while extracting.'
+                    });
+                }
+            }
+        });
+
+        this.jobTimeout = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Job Timeout (minutes):'),
+            name: 'job_timeout',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 10080,
+            value: 0,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Stop any extraction that runs longer than this many minutes, 0 for no limit.'
+                    });
+                }
+            }
+        });
+
+        this.stallTimeout = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Stall Timeout (minutes):'),
+            name: 'stall_timeout',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 10080,
+            value: 0,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Stop an extraction that shows no progress or output for this many minutes, 0 to never stop it.'
+                    });
+                }
+            }
+        });
+
+        this.extractWhileDownloading = this.performanceSet.add({
+            xtype: 'checkbox',
+            labelStyle: 'display: none',
+            boxLabel: _('Extract archives while the torrent downloads'),
+            name: 'extract_while_downloading',
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Starts extracting each archive set as soon as all of its volumes are downloaded, instead of waiting for the whole torrent.'
+                    });
+                }
+            }
+        });
+
+        this.extractNested = this.performanceSet.add({
+            xtype: 'checkbox',
+            labelStyle: 'display: none',
+            boxLabel: _('Extract archives found inside extracted archives'),
+            name: 'extract_nested',
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Looks for archives in what was just extracted (e.g. a rar set inside a zip) and extracts them as well, within the limits below.'
+                    });
+                }
+            }
+        });
+
+        this.nestedMaxDepth = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Nested Archive Depth:'),
+            name: 'nested_max_depth',
+            labelSeparator: '',
+            minValue: 1,
+            maxValue: 10,
+            value: 2,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'How many levels of archives inside archives are extracted.'
+                    });
+                }
+            }
+        });
+
+        this.nestedMaxRatio = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Nested Expansion Ratio Limit:'),
+            name: 'nested_max_ratio',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 100000,
+            value: 100,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Skip a nested archive that would extract to more than this many times its own size, 0 for no limit. Guards against zip bombs.'
+                    });
+                }
+            }
+        });
+
+        this.nestedMaxSize = this.performanceSet.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Nested Size Limit (MB):'),
+            name: 'nested_max_size',
+            labelSeparator: '',
+            minValue: 0,
+            maxValue: 10485760,
+            value: 51200,
+            width: 100,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Most data the nested archives of one archive may extract to, 0 for no limit.'
+                    });
+                }
+            }
+        });
+
+        this.verifyArchives = this.performanceSet.add({
+            xtype: 'combo',
+            fieldLabel: _('Verify Archives:'),
+            name: 'verify_archives',
+            labelSeparator: '',
+            mode: 'local',
+            store: [
+                ['off', _('Off')],
+                ['sfv', _('SFV files only')],
+                ['test', _('SFV, otherwise test the archive')]
+            ],
+            triggerAction: 'all',
+            editable: false,
+            forceSelection: true,
+            value: 'off',
+            width: 200,
+            listeners: {
+                render: function (c) {
+                    Ext.QuickTips.register({
+                        target: c,
+                        text: 'Check archives before extracting them, so a corrupt set fails straight away instead of part way through. SFV files next to the volumes are always used when verification is on.'
+                    });
+                }
+            }
+        });
+
         // Make sure we load the config as soon as the component is rendered
         this.on('afterrender', this.updateConfig, this);
         // Also update when shown
@@ -379,6 +760,25 @@ Deluge.ux.preferences.ExtractorPlusPage = Ext.extend(Ext.Panel, {
         config['auto_cleanup'] = this.autoCleanup.getValue();
         config['cleanup_time'] = this.autoCleanupTime.getValue();
         config['max_extract_threads'] = this.maxThreads.getValue();
+        config['native_extensions'] = this.splitList(this.nativeExtensions.getValue());
+        config['queue_priority'] = this.queuePriority.getValue() || 'age';
+        config['max_extract_per_device'] = this.maxPerDevice.getValue() || 0;
+        config['device_limits'] = this.parseLimits(this.deviceLimits.getValue());
+        config['metrics_port'] = this.metricsPort.getValue() || 0;
+        config['process_nice'] = this.processNice.getValue() || 0;
+        config['io_class'] = this.ioClass.getValue() || 'none';
+        config['cpu_affinity'] = Ext.util.Format.trim(this.cpuAffinity.getValue());
+        config['memory_limit'] = this.memoryLimit.getValue() || 0;
+        config['adaptive_concurrency'] = this.adaptiveConcurrency.getValue();
+        config['job_timeout'] = this.jobTimeout.getValue() || 0;
+        config['stall_timeout'] = this.stallTimeout.getValue() || 0;
+        config['extract_while_downloading'] = this.extractWhileDownloading.getValue();
+        config['member_filters'] = Ext.util.Format.trim(this.memberFilters.getValue());
+        config['extract_nested'] = this.extractNested.getValue();
+        config['nested_max_depth'] = this.nestedMaxDepth.getValue() || 1;
+        config['nested_max_ratio'] = this.nestedMaxRatio.getValue() || 0;
+        config['nested_max_size'] = this.nestedMaxSize.getValue() || 0;
+        config['verify_archives'] = this.verifyArchives.getValue() || 'off';
         
         console.log("Saving config:", config);
         
@@ -441,11 +841,57 @@ Deluge.ux.preferences.ExtractorPlusPage = Ext.extend(Ext.Panel, {
                 this.autoCleanup.setValue(config['auto_cleanup']);
                 this.autoCleanupTime.setValue(config['cleanup_time']);
                 this.maxThreads.setValue(config['max_extract_threads'] || 2);
+                this.nativeExtensions.setValue((config['native_extensions'] || []).join(', '));
+                this.queuePriority.setValue(config['queue_priority'] || 'age');
+                this.maxPerDevice.setValue(config['max_extract_per_device'] || 0);
+                var limits = [];
+                Ext.iterate(config['device_limits'] || {}, function (path, limit) {
+                    limits.push(path + '=' + limit);
+                });
+                this.deviceLimits.setValue(limits.join(', '));
+                this.metricsPort.setValue(config['metrics_port'] || 0);
+                this.processNice.setValue(config['process_nice'] || 0);
+                this.ioClass.setValue(config['io_class'] || 'none');
+                this.cpuAffinity.setValue(config['cpu_affinity'] || '');
+                this.memoryLimit.setValue(config['memory_limit'] || 0);
+                this.adaptiveConcurrency.setValue(config['adaptive_concurrency']);
+                this.jobTimeout.setValue(config['job_timeout'] || 0);
+                this.stallTimeout.setValue(config['stall_timeout'] || 0);
+                this.extractWhileDownloading.setValue(config['extract_while_downloading']);
+                this.memberFilters.setValue(config['member_filters'] || '');
+                this.extractNested.setValue(config['extract_nested']);
+                this.nestedMaxDepth.setValue(config['nested_max_depth'] || 1);
+                this.nestedMaxRatio.setValue(config['nested_max_ratio'] || 0);
+                this.nestedMaxSize.setValue(config['nested_max_size'] || 0);
+                this.verifyArchives.setValue(config['verify_archives'] || 'off');
             },
             scope: this
         });
     },
 
+    splitList: function (text) {
+        var values = [];
+        Ext.each((text || '').split(','), function (value) {
+            value = value.trim();
+            if (value) {
+                values.push(value);
+            }
+        });
+        return values;
+    },
+
+    parseLimits: function (text) {
+        var limits = {};
+        Ext.each(this.splitList(text), function (item) {
+            var idx = item.lastIndexOf('=');
+            var limit = parseInt(item.substring(idx + 1), 10);
+            if (idx > 0 && !isNaN(limit)) {
+                limits[item.substring(0, idx).trim()] = Math.max(0, limit);
+            }
+        });
+        return limits;
+    },
+
     setDestEnabled: function (enable) {
         console.log("SetDest: ", enable);
         this.destinationSet.setVisible(enable);
@@ -456,6 +902,116 @@ Deluge.ux.preferences.ExtractorPlusPage = Ext.extend(Ext.Panel, {
     }
 });
 
+Ext.ns('Deluge.ux');
+
+/**
+ * @class Deluge.ux.ExtractorPlusProgressWindow
+ * @extends Ext.Window
+ * Lists extraction jobs, refreshed from get_progress while the window is open.
+ */
+Deluge.ux.ExtractorPlusProgressWindow = Ext.extend(Ext.Window, {
+
+    title: _('Extraction Progress'),
+    layout: 'fit',
+    width: 640,
+    height: 300,
+    closeAction: 'hide',
+    plain: true,
+
+    initComponent: function () {
+        Deluge.ux.ExtractorPlusProgressWindow.superclass.initComponent.call(this);
+
+        this.store = new Ext.data.JsonStore({
+            idProperty: 'job_id',
+            fields: ['job_id', 'name', 'torrent_id', 'state', 'total', 'bytes_done', 'percent', 'rate', 'eta']
+        });
+
+        this.grid = this.add({
+            xtype: 'grid',
+            store: this.store,
+            border: false,
+            viewConfig: {forceFit: true},
+            columns: [
+                {header: _('Archive'), dataIndex: 'name', width: 200, sortable: true},
+                {header: _('State'), dataIndex: 'state', width: 70, sortable: true, renderer: Ext.util.Format.capitalize},
+                {header: _('Progress'), dataIndex: 'percent', width: 120, renderer: this.renderProgress},
+                {header: _('Speed'), dataIndex: 'rate', width: 80, renderer: this.renderSpeed},
+                {header: _('ETA'), dataIndex: 'eta', width: 70, renderer: this.renderEta}
+            ],
+            sm: new Ext.grid.RowSelectionModel({singleSelect: true}),
+            bbar: [
+                '->',
+                {
+                    text: _('Cancel Job'),
+                    iconCls: 'icon-remove',
+                    tooltip: _('Stop the selected queued or running extraction'),
+                    handler: this.onCancelJob,
+                    scope: this
+                }
+            ]
+        });
+
+        this.refreshTask = {
+            run: this.refresh,
+            scope: this,
+            interval: 2000
+        };
+        this.on('show', function () {
+            Ext.TaskMgr.start(this.refreshTask);
+        }, this);
+        this.on('hide', function () {
+            Ext.TaskMgr.stop(this.refreshTask);
+        }, this);
+    },
+
+    refresh: function () {
+        deluge.client.extractorplus.get_progress({
+            success: function (jobs) {
+                // Keep the selected job selected across refreshes, so it can be cancelled
+                var selected = this.grid.getSelectionModel().getSelected();
+                this.store.loadData(jobs);
+                if (selected) {
+                    var index = this.store.indexOfId(selected.id);
+                    if (index >= 0) {
+                        this.grid.getSelectionModel().selectRow(index);
+                    }
+                }
+            },
+            scope: this
+        });
+    },
+
+    onCancelJob: function () {
+        var selected = this.grid.getSelectionModel().getSelected();
+        if (!selected) return;
+        deluge.client.extractorplus.cancel_job(selected.get('job_id'), {
+            success: function (cancelled) {
+                if (!cancelled) {
+                    deluge.ui.notify(_('Extractor Plus'), _('The job has already finished'));
+                }
+                this.refresh();
+            },
+            scope: this
+        });
+    },
+
+    renderProgress: function (value, meta, record) {
+        var done = fsize(record.get('bytes_done'));
+        if (record.get('total')) {
+            done += ' / ' + fsize(record.get('total'));
+        }
+        return Deluge.progressBar(value || 0, this.width - 8, done);
+    },
+
+    renderSpeed: function (value, meta, record) {
+        return record.get('state') === 'running' ? fspeed(value) : '';
+    },
+
+    renderEta: function (value) {
+        return value ? ftime(value) : '';
+    }
+});
+
 // Create the proper plugin namespace
 Ext.ns('Deluge.plugins');
 
@@ -472,6 +1028,15 @@ Deluge.plugins.ExtractorPlusPlugin = Ext.extend(Deluge.Plugin, {
         if (this.tm) {
             deluge.menus.torrent.remove(this.tm);
         }
+
+        if (this.tmProgress) {
+            deluge.menus.torrent.remove(this.tmProgress);
+        }
+
+        if (this.progressWindow) {
+            this.progressWindow.destroy();
+            this.progressWindow = null;
+        }
         
         // Remove preference page
         if (this.prefsPage) {
@@ -495,23 +1060,41 @@ Deluge.plugins.ExtractorPlusPlugin = Ext.extend(Deluge.Plugin, {
             handler: this.onForceExtract,
             scope: this
         });
+
+        this.tmProgress = deluge.menus.torrent.add({
+            text: _('Extraction Progress'),
+            handler: this.onShowProgress,
+            scope: this
+        });
+    },
+
+    onShowProgress: function() {
+        if (!this.progressWindow) {
+            this.progressWindow = new Deluge.ux.ExtractorPlusProgressWindow();
+        }
+        this.progressWindow.show();
     },
     
     onForceExtract: function() {
         var torrentIds = deluge.torrents.getSelectedIds();
         if (!torrentIds || torrentIds.length === 0) return;
         
-        // Call the force_extract method for each selected torrent
-        Ext.each(torrentIds, function(torrentId) {
-            deluge.client.extractorplus.force_extract(torrentId, {
-                success: function(result) {
-                    if (result) {
-                        deluge.ui.notify(_('Force Extract'), _('Started extraction for selected torrent(s)'));
-                    } else {
-                        deluge.ui.notify(_('Force Extract'), _('Error: Could not extract selected torrent(s)'), 'error');
-                    }
+        // Plan and queue all selected torrents with a single call
+        deluge.client.extractorplus.force_extract_many(torrentIds, {
+            success: function(plan) {
+                var archives = 0;
+                Ext.each(plan, function(torrent) {
+                    archives += torrent.archives.length;
+                });
+                if (archives > 0) {
+                    deluge.ui.notify(_('Force Extract'), String.format(_('Started extraction of {0} archive(s)'), archives));
+                } else {
+                    deluge.ui.notify(_('Force Extract'), _('No archives to extract in the selected torrent(s)'));
                 }
-            });
+            },
+            failure: function() {
+                deluge.ui.notify(_('Force Extract'), _('Error: Could not extract selected torrent(s)'), 'error');
+            }
         });
     }
 });
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import errno
+import logging
+import os
+import shutil
+import sys
+
+log = logging.getLogger(__name__)
+
+
+def existing_parent(path):
+    """Returns `path` or its nearest ancestor that exists."""
+    path = os.path.abspath(str(path))
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def device_of(path):
+    """Returns the st_dev of the filesystem `path` lives on (or will live on, if it does not exist yet)."""
+    try:
+        return os.stat(existing_parent(path)).st_dev
+    except OSError as e:
+        log.debug("Could not stat %s: %s" % (path, e))
+        return None
+
+
+COPY_CHUNK = 64 * 1024 * 1024
+COPY_BUFFER = 8 * 1024 * 1024
+
+
+def same_device(src, dest):
+    """Returns True if `src` and the (possibly not yet existing) `dest` are on the same filesystem."""
+    src_dev = device_of(src)
+    return src_dev is not None and src_dev == device_of(dest)
+
+
+def _zero_copy(primitive, fsrc, fdst, offset, size):
+    """Copies from `offset` to `size` with copy_file_range or sendfile, returning where it stopped."""
+    while offset < size:
+        count = min(size - offset, COPY_CHUNK)
+        if primitive == 'copy_file_range':
+            done = os.copy_file_range(fsrc, fdst, count, offset, offset)
+        else:
+            done = os.sendfile(fdst, fsrc, offset, count)
+        if done == 0:
+            break
+        offset += done
+    return offset
+
+
+def copy_file(src, dest):
+    """
+    Copies one file using the kernel's zero-copy paths where available, falling back to a large buffer.
+
+    copy_file_range is tried first (it can reflink or copy server-side), then sendfile, and each fallback
+    resumes from wherever the previous method stopped.
+    """
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
+        for primitive in ('copy_file_range', 'sendfile'):
+            if offset >= size or not hasattr(os, primitive) or sys.platform.startswith('win'):
+                continue
+            try:
+                offset = _zero_copy(primitive, fsrc.fileno(), fdst.fileno(), offset, size)
+            except OSError as e:
+                if e.errno not in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.ENOTSUP, errno.EOPNOTSUPP):
+                    raise
+                log.debug("%s unavailable for %s: %s" % (primitive, src, e))
+        if offset < size:
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER)
+    shutil.copystat(src, dest)
+
+
+def copy_tree(src, dest):
+    """Copies a directory tree with copy_file, recreating symlinks rather than following them."""
+    os.makedirs(dest, exist_ok=True)
+    for entry in os.scandir(src):
+        target = os.path.join(dest, entry.name)
+        if entry.is_symlink():
+            os.symlink(os.readlink(entry.path), target)
+        elif entry.is_dir():
+            copy_tree(entry.path, target)
+        else:
+            copy_file(entry.path, target)
+    shutil.copystat(src, dest)
+
+
+def _is_dir(path):
+    return os.path.isdir(path) and not os.path.islink(path)
+
+
+def _free_name(path):
+    """Returns `path` with a ' (n)' suffix that does not exist yet."""
+    root, ext = os.path.splitext(path)
+    number = 1
+    while os.path.lexists('%s (%s)%s' % (root, number, ext)):
+        number += 1
+    return '%s (%s)%s' % (root, number, ext)
+
+
+def finalize_move(src, dest):
+    """
+    Moves an extracted file or directory from staging to its final name and returns the path it ended up at.
+
+    On the same filesystem this is a single atomic rename. Across filesystems the data is copied once to
+    a hidden `.extplus` name next to the destination and then renamed, so other programs never see a
+    partially written file under its final name. An existing destination directory is merged into and an
+    existing file is replaced, but an existing entry of the other type is kept and the new one renamed.
+    """
+    if _is_dir(dest) and _is_dir(src):
+        for name in os.listdir(src):
+            finalize_move(os.path.join(src, name), os.path.join(dest, name))
+        os.rmdir(src)
+        return dest
+
+    if os.path.lexists(dest) and (_is_dir(dest) or _is_dir(src)):
+        renamed = _free_name(dest)
+        log.warning("%s already exists as a %s, moving the extracted %s to %s instead"
+                    % (dest, 'directory' if _is_dir(dest) else 'file', 'directory' if _is_dir(src) else 'file',
+                       renamed))
+        dest = renamed
+
+    if same_device(src, os.path.dirname(dest)):
+        try:
+            os.replace(src, dest)
+            return dest
+        except OSError as e:
+            # Bind mounts share a device id but still refuse renames across them
+            if e.errno != errno.EXDEV:
+                raise
+
+    temp_dest = dest + '.extplus'
+    try:
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), temp_dest)
+        elif os.path.isdir(src):
+            copy_tree(src, temp_dest)
+        else:
+            copy_file(src, temp_dest)
+        os.replace(temp_dest, dest)
+    except Exception:
+        if os.path.isdir(temp_dest) and not os.path.islink(temp_dest):
+            shutil.rmtree(temp_dest, ignore_errors=True)
+        elif os.path.lexists(temp_dest):
+            os.remove(temp_dest)
+        raise
+    if os.path.isdir(src) and not os.path.islink(src):
+        shutil.rmtree(src)
+    else:
+        os.remove(src)
+    return dest
+
+
+def changed_since(path, since):
+    """
+    Returns True if `path` was created or modified at or after `since`.
+
+    The inode change time is checked as well as the modification time, as extractors restore the archived
+    mtime of what they write. Directories are not walked, a single lstat per entry keeps this cheap in a
+    destination holding a whole library; one changes when entries directly inside it are added or replaced.
+    """
+    # Allow for filesystems that store timestamps with a coarse granularity
+    since -= 2
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return st.st_mtime >= since or st.st_ctime >= since
+
+
+def walk_files(paths):
+    """Returns a {'path', 'size'} dict for every regular file among `paths` or anywhere below them."""
+    files = []
+    for path in paths:
+        if os.path.islink(path):
+            continue
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    full = os.path.join(root, name)
+                    if not os.path.islink(full):
+                        files.append({'path': full, 'size': os.path.getsize(full)})
+        elif os.path.isfile(path):
+            files.append({'path': path, 'size': os.path.getsize(path)})
+    return files
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import subprocess
+from shutil import which
+
+from deluge.common import windows_check
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+log = logging.getLogger(__name__)
+
+IO_CLASSES = {'none': None, 'realtime': '1', 'best-effort': '2', 'idle': '3'}
+
+
+def parse_cpus(value):
+    """Parses a CPU list like '0,2-3' into a set of CPU numbers, ignoring anything malformed."""
+    cpus = set()
+    for part in str(value or '').replace(' ', '').split(','):
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                cpus.update(range(int(start), int(end) + 1))
+            elif part:
+                cpus.add(int(part))
+        except ValueError:
+            log.warning("Ignoring invalid CPU list entry: %s" % part)
+    return cpus
+
+
+class ProcessGovernor(object):
+    """
+    Applies CPU priority, IO priority, CPU affinity and a memory limit to spawned extractors, so they yield to
+    libtorrent instead of competing with it.
+
+    The limits are applied by running the command through ionice, nice, taskset and prlimit, so they hold from
+    exec on and are inherited by any process the extractor spawns. Limits whose tool is missing are applied to
+    the started process instead. Nothing runs between fork and exec, which is unsafe with the worker threads
+    of deluged. On Windows only the CPU priority class is available.
+    """
+
+    def __init__(self, nice=0, io_class='none', io_level=4, cpus='', memory_mb=0):
+        self.nice = int(nice or 0)
+        self.io_class = IO_CLASSES.get(io_class)
+        self.io_level = max(0, min(int(io_level), 7))
+        self.cpus = parse_cpus(cpus)
+        self.memory = int(memory_mb or 0) * 1024 * 1024
+        posix = not windows_check()
+        self.ionice = which('ionice') if self.io_class and posix else None
+        if self.io_class and not self.ionice and posix:
+            log.warning("ionice not found, extractor IO priority will not be changed")
+        self.nice_tool = which('nice') if self.nice and posix else None
+        self.taskset = which('taskset') if self.cpus and posix else None
+        self.prlimit = which('prlimit') if self.memory and posix else None
+
+    def command(self, command):
+        """Returns `command` wrapped so it runs with the configured priorities, CPUs and memory limit."""
+        prefix = []
+        if self.ionice:
+            prefix += [self.ionice, '-c', self.io_class]
+            if self.io_class != IO_CLASSES['idle']:
+                prefix += ['-n', str(self.io_level)]
+        if self.nice_tool:
+            prefix += [self.nice_tool, '-n', str(self.nice)]
+        if self.taskset:
+            prefix += [self.taskset, '-c', ','.join(str(cpu) for cpu in sorted(self.cpus))]
+        if self.prlimit:
+            prefix += [self.prlimit, '--as=%s' % self.memory]
+        return prefix + command
+
+    def popen_kwargs(self):
+        """Returns the extra subprocess.Popen arguments applying the limits."""
+        if windows_check():
+            if self.nice >= 15:
+                return {'creationflags': subprocess.IDLE_PRIORITY_CLASS}
+            if self.nice > 0:
+                return {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+            return {}
+        return {}
+
+    def apply(self, process):
+        """Applies the limits no wrapper command was found for to a started extractor."""
+        if windows_check():
+            return
+        try:
+            if self.nice and not self.nice_tool:
+                os.setpriority(os.PRIO_PROCESS, process.pid, os.getpriority(os.PRIO_PROCESS, 0) + self.nice)
+            if self.cpus and not self.taskset and hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(process.pid, self.cpus)
+            if self.memory and not self.prlimit and hasattr(resource, 'prlimit'):
+                resource.prlimit(process.pid, resource.RLIMIT_AS, (self.memory, self.memory))
+        except (OSError, ValueError) as e:
+            # The extractor may already have exited, it still runs fine without the limit otherwise
+            log.debug("Could not limit extractor %s: %s" % (process.pid, e))
+
+
+class AdaptiveConcurrency(object):
+    """
+    Lowers the number of concurrent extractions while they visibly hurt seeding, and raises it back once they
+    do not.
+
+    The reference upload rate is learned while no extraction is running. Whenever jobs are running and the
+    upload rate falls more than `drop` below it, or libtorrent's disk queue grows past `disk_queue_limit`, one
+    worker is taken away; otherwise one is given back, up to the configured maximum.
+    """
+
+    def __init__(self, max_workers, drop=0.3, disk_queue_limit=64, min_rate=10 * 1024, smoothing=0.2):
+        self.max_workers = max(1, int(max_workers))
+        self.workers = self.max_workers
+        self.drop = drop
+        self.disk_queue_limit = disk_queue_limit
+        self.min_rate = min_rate
+        self.smoothing = smoothing
+        self.baseline = None
+
+    def update(self, upload_rate, disk_queue, running):
+        """Feeds one sample and returns the worker count to use."""
+        if not running:
+            if self.baseline is None:
+                self.baseline = upload_rate
+            else:
+                self.baseline += self.smoothing * (upload_rate - self.baseline)
+            self.workers = self.max_workers
+            return self.workers
+        degraded = disk_queue > self.disk_queue_limit
+        if self.baseline and self.baseline >= self.min_rate:
+            degraded = degraded or upload_rate < self.baseline * (1 - self.drop)
+        if degraded and self.workers > 1:
+            self.workers -= 1
+            log.info("Seeding degraded (%.0f B/s, %s queued disk jobs), using %s extraction worker(s)"
+                     % (upload_rate, disk_queue, self.workers))
+        elif not degraded and self.workers < self.max_workers:
+            self.workers += 1
+        return self.workers
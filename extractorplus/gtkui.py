@@ -20,10 +20,11 @@ import gi  # isort:skip (Required before Gtk import).
 gi.require_version('Gtk', '3.0')  # NOQA: E402
 
 # isort:imports-thirdparty
-from gi.repository import Gtk
+from gi.repository import GLib, Gtk
 
 # isort:imports-firstparty
 import deluge.component as component
+from deluge.common import fsize, fspeed, ftime
 from deluge.plugins.pluginbase import Gtk3PluginBase
 from deluge.ui.client import client
 
@@ -89,13 +90,21 @@ class GtkUI(Gtk3PluginBase):
         except Exception as e:
             log.error(f"Error deregistering selection callback: {e}")
         
-        # Remove the menu item
+        # Remove the menu items
         if hasattr(self, 'menu_item'):
             try:
                 component.get('MenuBar').torrentmenu.remove(self.menu_item)
                 self.menu_item = None
             except Exception as e:
                 log.error(f"Error removing menu item: {e}")
+        if getattr(self, 'progress_menu_item', None):
+            try:
+                component.get('MenuBar').torrentmenu.remove(self.progress_menu_item)
+                self.progress_menu_item = None
+            except Exception as e:
+                log.error(f"Error removing menu item: {e}")
+        if getattr(self, 'progress_dialog', None):
+            self.progress_dialog.close()
             
         del self.builder
 
@@ -120,6 +129,54 @@ class GtkUI(Gtk3PluginBase):
         except ValueError:
             max_threads = 2
 
+        try:
+            max_per_device = max(0, int(self.builder.get_object('max_extract_per_device').get_text()))
+        except ValueError:
+            max_per_device = 0
+
+        try:
+            metrics_port = max(0, int(self.builder.get_object('metrics_port').get_text() or 0))
+        except ValueError:
+            metrics_port = 0
+
+        try:
+            process_nice = min(max(0, int(self.builder.get_object('process_nice').get_text() or 0)), 19)
+        except ValueError:
+            process_nice = 10
+
+        try:
+            memory_limit = max(0, int(self.builder.get_object('memory_limit').get_text() or 0))
+        except ValueError:
+            memory_limit = 0
+
+        try:
+            job_timeout = max(0, int(self.builder.get_object('job_timeout').get_text() or 0))
+        except ValueError:
+            job_timeout = 0
+
+        try:
+            stall_timeout = max(0, int(self.builder.get_object('stall_timeout').get_text() or 0))
+        except ValueError:
+            stall_timeout = 0
+
+        try:
+            nested_max_depth = max(1, int(self.builder.get_object('nested_max_depth').get_text() or 2))
+        except ValueError:
+            nested_max_depth = 2
+
+        try:
+            nested_max_ratio = max(0, int(self.builder.get_object('nested_max_ratio').get_text() or 0))
+        except ValueError:
+            nested_max_ratio = 100
+
+        try:
+            nested_max_size = max(0, int(self.builder.get_object('nested_max_size').get_text() or 0))
+        except ValueError:
+            nested_max_size = 51200
+
+        buffer = self.builder.get_object('member_filters').get_buffer()
+        member_filters = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False).strip()
+
         config = {
             'extract_path': path,
             'extract_selected_folder': self.builder.get_object("extract_selected_folder").get_active(),
@@ -132,7 +189,26 @@ class GtkUI(Gtk3PluginBase):
             'cleanup_time': cleanup_time,
             'auto_cleanup': self.builder.get_object("auto_cleanup").get_active(),
             'append_archive_name': self.builder.get_object('append_archive_name').get_active(),
-            'max_extract_threads': max_threads
+            'max_extract_threads': max_threads,
+            'native_extensions': self.split_list(self.builder.get_object('native_extensions').get_text()),
+            'queue_priority': self.builder.get_object('queue_priority').get_active_id() or 'age',
+            'max_extract_per_device': max_per_device,
+            'device_limits': self.parse_limits(self.builder.get_object('device_limits').get_text()),
+            'metrics_port': metrics_port,
+            'process_nice': process_nice,
+            'io_class': self.builder.get_object('io_class').get_active_id() or 'none',
+            'cpu_affinity': self.builder.get_object('cpu_affinity').get_text().strip(),
+            'memory_limit': memory_limit,
+            'adaptive_concurrency': self.builder.get_object('adaptive_concurrency').get_active(),
+            'job_timeout': job_timeout,
+            'stall_timeout': stall_timeout,
+            'extract_while_downloading': self.builder.get_object('extract_while_downloading').get_active(),
+            'member_filters': member_filters,
+            'extract_nested': self.builder.get_object('extract_nested').get_active(),
+            'nested_max_depth': nested_max_depth,
+            'nested_max_ratio': nested_max_ratio,
+            'nested_max_size': nested_max_size,
+            'verify_archives': self.builder.get_object('verify_archives').get_active_id() or 'off'
         }
 
         client.extractorplus.set_config(config)
@@ -154,6 +230,29 @@ class GtkUI(Gtk3PluginBase):
             
             # Setup max threads field
             self.builder.get_object('max_extract_threads').set_text(str(config.get('max_extract_threads', 2)))
+            self.builder.get_object('native_extensions').set_text(', '.join(config.get('native_extensions', [])))
+            self.builder.get_object('queue_priority').set_active_id(config.get('queue_priority', 'age'))
+            self.builder.get_object('max_extract_per_device').set_text(str(config.get('max_extract_per_device', 0)))
+            self.builder.get_object('device_limits').set_text(
+                ', '.join('%s=%s' % (k, v) for k, v in config.get('device_limits', {}).items())
+            )
+            self.builder.get_object('metrics_port').set_text(str(config.get('metrics_port', 0)))
+            self.builder.get_object('process_nice').set_text(str(config.get('process_nice', 10)))
+            self.builder.get_object('io_class').set_active_id(config.get('io_class', 'best-effort'))
+            self.builder.get_object('cpu_affinity').set_text(config.get('cpu_affinity', ''))
+            self.builder.get_object('memory_limit').set_text(str(config.get('memory_limit', 0)))
+            self.builder.get_object('adaptive_concurrency').set_active(config.get('adaptive_concurrency', False))
+            self.builder.get_object('job_timeout').set_text(str(config.get('job_timeout', 0)))
+            self.builder.get_object('stall_timeout').set_text(str(config.get('stall_timeout', 0)))
+            self.builder.get_object('extract_while_downloading').set_active(
+                config.get('extract_while_downloading', False)
+            )
+            self.builder.get_object('member_filters').get_buffer().set_text(config.get('member_filters', ''))
+            self.builder.get_object('extract_nested').set_active(config.get('extract_nested', False))
+            self.builder.get_object('nested_max_depth').set_text(str(config.get('nested_max_depth', 2)))
+            self.builder.get_object('nested_max_ratio').set_text(str(config.get('nested_max_ratio', 100)))
+            self.builder.get_object('nested_max_size').set_text(str(config.get('nested_max_size', 51200)))
+            self.builder.get_object('verify_archives').set_active_id(config.get('verify_archives', 'off'))
             
             use_selected = config['extract_selected_folder']
             cleanup_time = config['cleanup_time']
@@ -179,6 +278,23 @@ class GtkUI(Gtk3PluginBase):
 
         client.extractorplus.get_config().addCallback(on_get_config)
 
+    @staticmethod
+    def split_list(text):
+        """Turns a comma-separated entry into a list of trimmed, non-empty values"""
+        return [v.strip() for v in text.split(',') if v.strip()]
+
+    def parse_limits(self, text):
+        """Turns 'path=limit, path=limit' into a dict, skipping malformed entries"""
+        limits = {}
+        for item in self.split_list(text):
+            path, _, limit = item.rpartition('=')
+            try:
+                if path.strip():
+                    limits[path.strip()] = max(0, int(limit))
+            except ValueError:
+                log.warning(f"Ignoring invalid disk limit: {item}")
+        return limits
+
     def on_target_change(self, show):
         if show:
             self.builder.get_object('destination_frame').show()
@@ -212,6 +328,12 @@ class GtkUI(Gtk3PluginBase):
         self.menu_item.connect('activate', self._on_menu_force_extract)
         self.menu_item.show()
         torrentmenu.append(self.menu_item)
+
+        self.progress_dialog = None
+        self.progress_menu_item = Gtk.MenuItem(label=_('Extraction Progress'))
+        self.progress_menu_item.connect('activate', self._on_menu_show_progress)
+        self.progress_menu_item.show()
+        torrentmenu.append(self.progress_menu_item)
         
         # Register for updates on torrent selection
         component.get("TorrentView").register_selection_callback(self._on_torrent_selection_changed)
@@ -229,10 +351,102 @@ class GtkUI(Gtk3PluginBase):
         # Get selected torrents
         selected = component.get("TorrentView").get_selected_torrents()
         if selected:
-            for torrent_id in selected:
-                log.info(f"Force extracting {torrent_id}")
-                client.extractorplus.force_extract(torrent_id)
+            log.info(f"Force extracting {len(selected)} torrent(s)")
+            client.extractorplus.force_extract_many(selected)
                 
+    def _on_menu_show_progress(self, widget):
+        """Handler for the Extraction Progress menu item"""
+        if self.progress_dialog is None:
+            self.progress_dialog = ProgressDialog(self._on_progress_closed)
+        self.progress_dialog.present()
+
+    def _on_progress_closed(self):
+        self.progress_dialog = None
+
     def on_torrent_menu_items(self, menu, selected_torrent_ids):
         """This is kept for compatibility with other hooks but not used"""
         pass
+
+
+class ProgressDialog(object):
+    """Window listing extraction jobs, refreshed from the get_progress RPC while it is open"""
+
+    REFRESH_SECONDS = 2
+
+    def __init__(self, on_close):
+        self.on_close = on_close
+        self.window = Gtk.Window(title=_('Extraction Progress'))
+        self.window.set_default_size(640, 300)
+        self.window.connect('destroy', self._on_destroy)
+
+        # job_id, archive, state, percent, done/total, speed, eta
+        self.store = Gtk.ListStore(str, str, str, int, str, str, str)
+        self.view = Gtk.TreeView(model=self.store)
+        for idx, title in ((1, _('Archive')), (2, _('State'))):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=idx)
+            column.set_resizable(True)
+            self.view.append_column(column)
+        self.view.append_column(Gtk.TreeViewColumn(_('Progress'), Gtk.CellRendererProgress(), value=3, text=4))
+        for idx, title in ((5, _('Speed')), (6, _('ETA'))):
+            self.view.append_column(Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=idx))
+
+        self.box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(self.view)
+        self.box.pack_start(scrolled, True, True, 0)
+        buttons = Gtk.ButtonBox(orientation=Gtk.Orientation.HORIZONTAL)
+        buttons.set_layout(Gtk.ButtonBoxStyle.END)
+        self.cancel_button = Gtk.Button(label=_('Cancel Job'))
+        self.cancel_button.set_tooltip_text(_('Stop the selected queued or running extraction'))
+        self.cancel_button.connect('clicked', self._on_cancel_clicked)
+        buttons.pack_start(self.cancel_button, False, False, 0)
+        self.box.pack_start(buttons, False, False, 4)
+        self.window.add(self.box)
+        self.window.show_all()
+
+        self.timer = GLib.timeout_add_seconds(self.REFRESH_SECONDS, self.refresh)
+        self.refresh()
+
+    def present(self):
+        self.window.present()
+
+    def close(self):
+        self.window.destroy()
+
+    def refresh(self):
+        client.extractorplus.get_progress().addCallback(self._on_progress)
+        return True
+
+    def _on_progress(self, jobs):
+        # Keep the selected job selected across refreshes, so it can be cancelled
+        model, tree_iter = self.view.get_selection().get_selected()
+        selected = model[tree_iter][0] if tree_iter is not None else None
+        self.store.clear()
+        for job in jobs:
+            percent = job['percent']
+            done = fsize(job['bytes_done'])
+            if job['total']:
+                done = '%s / %s' % (done, fsize(job['total']))
+            self.store.append([
+                job['job_id'],
+                job['name'],
+                job['state'].capitalize(),
+                int(percent or 0),
+                done,
+                fspeed(job['rate']) if job['state'] == 'running' else '',
+                ftime(job['eta']) if job['eta'] else '',
+            ])
+            if job['job_id'] == selected:
+                self.view.get_selection().select_iter(self.store[-1].iter)
+
+    def _on_cancel_clicked(self, widget):
+        model, tree_iter = self.view.get_selection().get_selected()
+        if tree_iter is None:
+            return
+        job_id = model[tree_iter][0]
+        log.info("Cancelling extraction job %s" % job_id)
+        client.extractorplus.cancel_job(job_id).addCallback(lambda result: self.refresh())
+
+    def _on_destroy(self, widget):
+        GLib.source_remove(self.timer)
+        self.on_close()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import signal
+import time
+from threading import Lock, Timer
+
+from deluge.common import windows_check
+
+log = logging.getLogger(__name__)
+
+# Seconds a killed extractor gets to exit on SIGTERM before it is sent SIGKILL
+KILL_GRACE = 5
+
+
+def new_process_group():
+    """Returns the Popen arguments that start an extractor in its own process group."""
+    if windows_check():
+        return {}
+    return {'start_new_session': True}
+
+
+def kill_process_group(process):
+    """Terminates an extractor started with new_process_group() along with any children it spawned."""
+    if process.poll() is not None:
+        return
+    if windows_check():
+        process.kill()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except OSError:
+        return
+
+    def force():
+        if process.poll() is None:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    timer = Timer(KILL_GRACE, force)
+    timer.daemon = True
+    timer.start()
+
+
+class JobHandle(object):
+    """Control handle of one queued or running extraction job."""
+
+    def __init__(self, job_id, torrent_id, name):
+        self.job_id = job_id
+        self.torrent_id = torrent_id
+        self.name = name
+        self.processes = []
+        self.extractor = None
+        # Why the job was stopped, None while it is allowed to run
+        self.cancelled = None
+        self._lock = Lock()
+
+    def attach(self, process):
+        """Tracks a spawned extractor, killing it straight away if the job was cancelled meanwhile."""
+        with self._lock:
+            self.processes.append(process)
+            cancelled = self.cancelled
+        if cancelled:
+            kill_process_group(process)
+
+    def attach_extractor(self, extractor):
+        """Tracks an in-process NativeExtractor, which stops at the next member once cancelled."""
+        with self._lock:
+            self.extractor = extractor
+            if self.cancelled:
+                extractor.cancel()
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = reason
+            processes = list(self.processes)
+            extractor = self.extractor
+        log.warning("Stopping extraction of %s: %s" % (self.name, reason))
+        for process in processes:
+            kill_process_group(process)
+        if extractor is not None:
+            extractor.cancel()
+
+    def pids(self):
+        with self._lock:
+            return [p.pid for p in self.processes if p.poll() is None]
+
+
+class JobControl(object):
+    """Registry of job handles, with a watchdog enforcing wall-clock and no-progress timeouts."""
+
+    def __init__(self, progress):
+        """
+        Args:
+            progress (ProgressTracker): Source of each job's start and last progress times
+        """
+        self.progress = progress
+        self._lock = Lock()
+        self._handles = {}
+
+    def add(self, handle):
+        with self._lock:
+            self._handles[handle.job_id] = handle
+
+    def get(self, job_id):
+        with self._lock:
+            return self._handles.get(job_id)
+
+    def remove(self, job_id):
+        with self._lock:
+            return self._handles.pop(job_id, None)
+
+    def cancel(self, job_id, reason='cancelled'):
+        """Cancels a queued or running job, returning False if it is unknown or already finished."""
+        handle = self.get(job_id)
+        if handle is None:
+            return False
+        handle.cancel(reason)
+        return True
+
+    def list(self):
+        """Returns the queued and running jobs as RPC friendly dicts."""
+        with self._lock:
+            handles = list(self._handles.values())
+        jobs = []
+        for handle in handles:
+            progress = self.progress.get(handle.job_id)
+            job = progress.to_dict() if progress is not None else {'job_id': handle.job_id, 'name': handle.name}
+            job['pids'] = handle.pids()
+            job['cancelled'] = handle.cancelled
+            jobs.append(job)
+        return jobs
+
+    def check_timeouts(self, wall_timeout, stall_timeout):
+        """
+        Cancels running jobs that exceeded `wall_timeout` seconds in total or reported no progress (or output)
+        for `stall_timeout` seconds. A timeout of 0 disables that check.
+        """
+        now = time.time()
+        with self._lock:
+            handles = list(self._handles.values())
+        for handle in handles:
+            progress = self.progress.get(handle.job_id)
+            if handle.cancelled or progress is None or progress.state != 'running':
+                continue
+            if wall_timeout and now - progress.started_at > wall_timeout:
+                handle.cancel('timed out after %d minute(s)' % (wall_timeout // 60))
+            elif stall_timeout and now - progress.updated_at > stall_timeout:
+                handle.cancel('no progress for %d minute(s)' % (stall_timeout // 60))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import time
+from threading import Lock
+
+from deluge.config import Config
+from deluge.configmanager import get_config_dir
+
+log = logging.getLogger(__name__)
+
+
+def parse_label_filter(label_filter):
+    """Returns the labels listed in the comma separated `label_filter`, in order, ignoring whitespace."""
+    return [label for label in label_filter.replace(" ", "").split(",") if label]
+
+
+class LabelIndex(object):
+    """
+    In-memory torrent_id -> labels map built from the Label and LabelPlus plugin configs.
+
+    The config files are only parsed again when their mtime changes, and their mtimes are checked at most
+    once every `recheck` seconds, so a burst of finished torrents costs a few stats rather than a JSON
+    parse per torrent.
+    """
+
+    FILES = ('label.conf', 'labelplus.conf')
+
+    def __init__(self, recheck=2.0):
+        self.recheck = recheck
+        self._lock = Lock()
+        self._mtimes = {}
+        self._labels = {}
+        self._checked_at = 0
+
+    def labels(self, torrent_id):
+        """Returns the labels of a torrent, Label's first, then LabelPlus's."""
+        with self._lock:
+            now = time.time()
+            if now - self._checked_at >= self.recheck:
+                self._checked_at = now
+                self._refresh()
+            return list(self._labels.get(torrent_id, ()))
+
+    def invalidate(self):
+        """Forces the config files to be read again on the next lookup."""
+        with self._lock:
+            self._mtimes = {}
+            self._checked_at = 0
+
+    def _refresh(self):
+        mtimes = {}
+        for name in self.FILES:
+            try:
+                mtimes[name] = os.path.getmtime(get_config_dir(name))
+            except OSError:
+                mtimes[name] = None
+        if mtimes == self._mtimes:
+            return
+        log.debug("Label configs changed, rebuilding the label index")
+        self._mtimes = mtimes
+        index = {}
+        if mtimes['label.conf'] is not None:
+            config = self._load('label.conf')
+            for torrent_id, label in config.get('torrent_labels', {}).items():
+                index.setdefault(torrent_id, []).append(label)
+        if mtimes['labelplus.conf'] is not None:
+            config = self._load('labelplus.conf')
+            labels = config.get('labels', {})
+            for torrent_id, mapping in config.get('mappings', {}).items():
+                if mapping in labels:
+                    index.setdefault(torrent_id, []).append(labels[mapping]['name'])
+        self._labels = index
+
+    @staticmethod
+    def _load(name):
+        try:
+            return Config(name, config_dir=get_config_dir()).config
+        except Exception as e:
+            log.warning("Could not read %s: %s" % (name, e))
+            return {}
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+
+log = logging.getLogger(__name__)
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS extracted (
+        path TEXT PRIMARY KEY,
+        torrent_id TEXT,
+        size INTEGER NOT NULL DEFAULT 0,
+        extracted_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS extracted_torrent ON extracted (torrent_id)",
+    "CREATE INDEX IF NOT EXISTS extracted_time ON extracted (extracted_at)",
+    """CREATE TABLE IF NOT EXISTS fingerprints (
+        archive TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        torrent_id TEXT,
+        outputs TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (archive, destination)
+    )""",
+    "CREATE INDEX IF NOT EXISTS fingerprints_torrent ON fingerprints (torrent_id)",
+    """CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        torrent_id TEXT,
+        archive TEXT NOT NULL,
+        destination TEXT NOT NULL,
+        staging TEXT,
+        state TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )""",
+]
+
+# Bytes hashed from each end of the first volume for a partial-hash fingerprint
+PARTIAL_HASH_BYTES = 64 * 1024
+
+
+def path_size(path):
+    """Returns the size of a file, or the total size of a directory tree."""
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    except OSError:
+        return 0
+
+
+def archive_fingerprint(paths, partial_hash=False):
+    """
+    Returns a fingerprint of an archive set from its volumes' paths, sizes and mtimes, or None if a volume
+    is missing.
+
+    With `partial_hash` the start and end of the first volume are hashed as well, which catches a volume
+    replaced by one with the same size and a preserved mtime.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        digest.update(('%s\0%s\0%s\n' % (path, st.st_size, st.st_mtime)).encode('utf-8'))
+    if partial_hash and paths:
+        try:
+            with open(paths[0], 'rb') as f:
+                digest.update(f.read(PARTIAL_HASH_BYTES))
+                size = os.fstat(f.fileno()).st_size
+                if size > PARTIAL_HASH_BYTES:
+                    f.seek(max(size - PARTIAL_HASH_BYTES, PARTIAL_HASH_BYTES))
+                    digest.update(f.read(PARTIAL_HASH_BYTES))
+        except OSError:
+            return None
+    return digest.hexdigest()
+
+
+class ExtractionLedger(object):
+    """
+    Indexed store of everything the plugin has extracted, keyed by path.
+
+    Inserts are buffered in memory and written in batches, so recording an extracted file never rewrites
+    the whole history the way the old `extracted` config list did.
+    """
+
+    def __init__(self, db_path, batch_size=200):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._lock = Lock()
+        self._pending = {}
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+
+    def add(self, path, torrent_id=None, size=None, extracted_at=None):
+        """Queue an extracted path for insertion, flushing once a full batch is pending."""
+        if size is None:
+            size = path_size(path)
+        if extracted_at is None:
+            extracted_at = time.time()
+        with self._lock:
+            self._pending[str(path)] = (str(path), torrent_id, size, extracted_at)
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        """Write all pending inserts in a single transaction."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        rows = list(self._pending.values())
+        self._pending.clear()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO extracted (path, torrent_id, size, extracted_at) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def remove(self, paths):
+        """Forget the given paths."""
+        paths = [str(p) for p in paths]
+        if not paths:
+            return
+        with self._lock:
+            for p in paths:
+                self._pending.pop(p, None)
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM extracted WHERE path = ?", [(p,) for p in paths])
+
+    def entries(self):
+        """Returns a list of (path, torrent_id, size, extracted_at) tuples."""
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT path, torrent_id, size, extracted_at FROM extracted").fetchall()
+
+    def expired(self, cutoff, limit=500):
+        """Returns up to `limit` paths extracted at or before `cutoff`, oldest first."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM extracted WHERE extracted_at <= ? ORDER BY extracted_at LIMIT ?", (cutoff, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def oldest(self):
+        """Returns the earliest extraction time in the ledger, or None if it is empty."""
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT MIN(extracted_at) FROM extracted").fetchone()[0]
+
+    def __contains__(self, path):
+        path = str(path)
+        with self._lock:
+            if path in self._pending:
+                return True
+            return self._conn.execute("SELECT 1 FROM extracted WHERE path = ?", (path,)).fetchone() is not None
+
+    def __len__(self):
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM extracted").fetchone()[0]
+
+    def fingerprint(self, archive, destination):
+        """Returns (fingerprint, [(path, size), ...]) recorded for an archive and destination, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, outputs FROM fingerprints WHERE archive = ? AND destination = ?",
+                (str(archive), str(destination))
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], [tuple(output) for output in json.loads(row[1])]
+
+    def set_fingerprint(self, archive, destination, fingerprint, torrent_id, outputs):
+        """Records that `archive` was extracted into `destination`, producing `outputs` as (path, size) pairs."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO fingerprints (archive, destination, fingerprint, torrent_id, outputs, "
+                    "created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (str(archive), str(destination), fingerprint, torrent_id, json.dumps(outputs), time.time())
+                )
+
+    def invalidate_fingerprints(self, torrent_ids=None):
+        """Forgets the fingerprints of the given torrents, or all of them, returning how many were removed."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                if torrent_ids is None:
+                    cursor = self._conn.execute("DELETE FROM fingerprints")
+                else:
+                    cursor = self._conn.executemany(
+                        "DELETE FROM fingerprints WHERE torrent_id = ?", [(t,) for t in torrent_ids]
+                    )
+                return cursor.rowcount
+
+    def journal(self, job_id, state, torrent_id=None, archive=None, destination=None, staging=None):
+        """
+        Records a job's state transition (queued, running, finalizing), written through immediately so it
+        survives a daemon crash. Finished jobs are removed with journal_done() rather than marked done.
+
+        The first call for a job (state 'queued') must give its torrent, archive and destination; later calls
+        only update the state and, once known, the staging directory.
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                if archive is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO jobs (job_id, torrent_id, archive, destination, staging, state, "
+                        "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, torrent_id, str(archive), str(destination),
+                         str(staging) if staging else None, state, time.time())
+                    )
+                else:
+                    self._conn.execute(
+                        "UPDATE jobs SET state = ?, staging = COALESCE(?, staging), updated_at = ? WHERE job_id = ?",
+                        (state, str(staging) if staging else None, time.time(), job_id)
+                    )
+
+    def journal_done(self, job_ids):
+        """Removes finished (done, failed or cancelled) jobs from the journal."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("DELETE FROM jobs WHERE job_id = ?", [(j,) for j in job_ids])
+
+    def unfinished_jobs(self):
+        """Returns dicts of every job that was queued but never finished, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, torrent_id, archive, destination, staging, state, updated_at FROM jobs "
+                "ORDER BY updated_at"
+            ).fetchall()
+        keys = ('job_id', 'torrent_id', 'archive', 'destination', 'staging', 'state', 'updated_at')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def migrate(self, legacy_paths):
+        """One-time import of the legacy `extracted` config list."""
+        for path in legacy_paths:
+            try:
+                extracted_at = os.path.getmtime(path)
+            except OSError:
+                # Missing files are dropped here instead of being tracked only to be pruned later.
+                continue
+            self.add(path, None, path_size(path), extracted_at)
+        self.flush()
+        log.info("Migrated %s legacy extracted entries into %s" % (len(legacy_paths), self.db_path))
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._conn.close()
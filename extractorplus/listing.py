@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import re
+import struct
+import subprocess
+import tarfile
+import zipfile
+
+log = logging.getLogger(__name__)
+
+LIST_TIMEOUT = 60
+# Assumed expansion when the uncompressed size cannot be read without decompressing the whole archive
+UNKNOWN_RATIO = 3
+
+UNRAR_SIZE_RE = re.compile(r'^\s*Size:\s*(\d+)\s*$', re.MULTILINE)
+SEVEN_ZIP_SIZE_RE = re.compile(r'^Size = (\d+)\s*$', re.MULTILINE)
+# Field lines of `unrar lt` and `7z l -slt` listings
+UNRAR_FIELD_RE = re.compile(r'^\s*(Name|Type|Size):\s(.*)$')
+SEVEN_ZIP_FIELD_RE = re.compile(r'^(Path|Folder|Size) = (.*)$')
+
+
+def _run(command):
+    try:
+        ps = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+                            timeout=LIST_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        log.debug("Listing with %s failed: %s" % (command[0], e))
+        return None
+    if ps.returncode != 0:
+        return None
+    return ps.stdout.decode('utf-8', 'replace')
+
+
+def _unrar_size(path, unrar):
+    # -p- never waits for a password on encrypted headers
+    output = _run([unrar, 'lt', '-p-', path])
+    if output is None:
+        return None
+    return sum(int(size) for size in UNRAR_SIZE_RE.findall(output))
+
+
+def _seven_zip_size(path, seven_zip):
+    output = _run([seven_zip, 'l', '-slt', '-p', path])
+    if output is None or '----------' not in output:
+        return None
+    # Everything before the separator describes the archive itself
+    entries = output.split('----------', 1)[1]
+    return sum(int(size) for size in SEVEN_ZIP_SIZE_RE.findall(entries))
+
+
+def _gzip_size(path):
+    # ISIZE, the last four bytes of a gzip member, is the uncompressed size modulo 2^32
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        isize = struct.unpack('<I', f.read(4))[0]
+    compressed = os.path.getsize(path)
+    while isize < compressed:
+        isize += 1 << 32
+    return isize
+
+
+def _xz_size(path, xz):
+    output = _run([xz, '--robot', '--list', path])
+    if output is None:
+        return None
+    for line in output.splitlines():
+        fields = line.split('\t')
+        if fields[0] == 'totals' and len(fields) > 4:
+            return int(fields[4])
+    return None
+
+
+def guessed_size(path, archive_size=None):
+    """Returns UNKNOWN_RATIO times `archive_size` (the whole set's size) or the file's own size."""
+    try:
+        return (archive_size or os.path.getsize(path)) * UNKNOWN_RATIO
+    except OSError:
+        return 0
+
+
+def listed_size(path, kind, unrar=None, seven_zip=None, xz=None):
+    """
+    Returns the total size `path` will extract to, read from the archive's own index where that is cheap:
+    the zip central directory, tar headers, the gzip trailer, the xz index or the unrar/7z listing. Returns
+    None if there is no such listing.
+
+    Multi-volume sets are listed through their first volume, so `path` should be the one the extractor opens.
+    """
+    size = None
+    try:
+        if kind == '.zip' and zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                size = sum(info.file_size for info in zf.infolist())
+        elif kind == '.tar':
+            with tarfile.open(path, 'r:') as tf:
+                size = sum(member.size for member in tf)
+        elif kind in ('.tar.gz', '.tgz'):
+            size = _gzip_size(path)
+        elif kind in ('.tar.xz', '.txz') and xz:
+            size = _xz_size(path, xz)
+        elif kind == '.rar' and unrar:
+            size = _unrar_size(path, unrar)
+        if size is None and kind in ('.rar', '.7z', '.zip') and seven_zip:
+            size = _seven_zip_size(path, seven_zip)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, struct.error) as e:
+        log.debug("Could not read the listing of %s: %s" % (path, e))
+        size = None
+    return size
+
+
+def _unrar_members(path, unrar):
+    output = _run([unrar, 'lt', '-p-', path])
+    if output is None:
+        return None
+    members = []
+    entry = {}
+    for line in output.splitlines() + ['']:
+        match = UNRAR_FIELD_RE.match(line)
+        if match:
+            if match.group(1) == 'Name' and entry:
+                members.append(entry)
+                entry = {}
+            entry[match.group(1)] = match.group(2).strip()
+    if entry:
+        members.append(entry)
+    return [(m['Name'], int(m.get('Size') or 0)) for m in members if 'Name' in m and m.get('Type') != 'Directory']
+
+
+def _seven_zip_members(path, seven_zip):
+    output = _run([seven_zip, 'l', '-slt', '-p', path])
+    if output is None or '----------' not in output:
+        return None
+    members = []
+    for block in output.split('----------', 1)[1].split('\n\n'):
+        entry = dict(match.groups() for match in map(SEVEN_ZIP_FIELD_RE.match, block.splitlines()) if match)
+        if 'Path' in entry and entry.get('Folder') != '+':
+            members.append((entry['Path'].strip(), int(entry.get('Size') or 0)))
+    return members
+
+
+def archive_members(path, kind, unrar=None, seven_zip=None):
+    """
+    Returns the (name, size) of every file in an archive, or None if it cannot be listed.
+
+    Compressed tarballs are not listed here, as that means decompressing them completely; the native engine
+    filters their members while it extracts instead.
+    """
+    try:
+        if kind == '.zip' and zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as zf:
+                return [(info.filename, info.file_size) for info in zf.infolist() if not info.is_dir()]
+        if kind == '.tar':
+            with tarfile.open(path, 'r:') as tf:
+                return [(member.name, member.size) for member in tf if member.isfile()]
+        if kind == '.rar' and unrar:
+            members = _unrar_members(path, unrar)
+            if members is not None:
+                return members
+        if kind in ('.rar', '.7z', '.zip') and seven_zip:
+            return _seven_zip_members(path, seven_zip)
+    except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as e:
+        log.debug("Could not list the members of %s: %s" % (path, e))
+    return None
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import tempfile
+from fnmatch import fnmatchcase
+
+log = logging.getLogger(__name__)
+
+# Rule for torrents whose labels have no rule of their own
+DEFAULT_RULE = '*'
+
+
+class MemberFilter(object):
+    """
+    Decides which members of an archive are extracted: those matching one of the include globs (all of them
+    when there are none), matching none of the exclude globs and at least `min_size` bytes large.
+
+    Globs are matched case-insensitively against both the member's path and its file name.
+    """
+
+    def __init__(self, include=(), exclude=(), min_size=0):
+        self.include = [glob.lower() for glob in include]
+        self.exclude = [glob.lower() for glob in exclude]
+        self.min_size = int(min_size)
+
+    @property
+    def active(self):
+        return bool(self.include or self.exclude or self.min_size)
+
+    @staticmethod
+    def _match(name, globs):
+        return any(fnmatchcase(name, glob) or fnmatchcase(os.path.basename(name), glob) for glob in globs)
+
+    def wanted(self, name, size):
+        name = name.replace('\\', '/').lower()
+        if self.include and not self._match(name, self.include):
+            return False
+        if self._match(name, self.exclude):
+            return False
+        return size >= self.min_size
+
+    def select(self, members):
+        """Returns the names of the wanted ones of a list of (name, size) file members."""
+        return [name for name, size in members if self.wanted(name, size)]
+
+    def __repr__(self):
+        return '<MemberFilter include=%s exclude=%s min_size=%s>' % (self.include, self.exclude, self.min_size)
+
+
+def _globs(value):
+    return [glob.strip() for glob in value.split(',') if glob.strip()]
+
+
+def parse_member_filters(text):
+    """
+    Parses the member filter rules, one per line:
+
+        label | include globs | exclude globs | minimum size in MB
+
+    Globs are comma-separated and any field but the label may be left empty. The label `*` applies to torrents
+    no other rule matches, lines starting with # are ignored.
+
+    Returns:
+        dict: lowercase label -> MemberFilter
+    """
+    filters = {}
+    for number, line in enumerate(str(text or '').splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = [field.strip() for field in line.split('|')] + [''] * 3
+        label, include, exclude, min_size = fields[:4]
+        if not label:
+            log.warning("Ignoring member filter on line %s, it has no label" % number)
+            continue
+        try:
+            min_bytes = int(float(min_size or 0) * 1024 * 1024)
+        except ValueError:
+            log.warning("Ignoring member filter on line %s, invalid minimum size: %s" % (number, min_size))
+            continue
+        # A rule without any criteria still matters, it exempts its label from the default rule
+        filters[label.lower()] = MemberFilter(_globs(include), _globs(exclude), min_bytes)
+    return filters
+
+
+def filter_for(filters, labels):
+    """Returns the MemberFilter for a torrent with `labels`, or None if everything is to be extracted."""
+    member_filter = None
+    for label in labels:
+        member_filter = filters.get(label.lower())
+        if member_filter is not None:
+            break
+    else:
+        member_filter = filters.get(DEFAULT_RULE)
+    return member_filter if member_filter is not None and member_filter.active else None
+
+
+def write_list_file(names):
+    """Writes member names to a UTF-8 list file for unrar/7z/tar and returns its path."""
+    fd, path = tempfile.mkstemp(prefix='extractorplus-', suffix='.lst')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for name in names:
+            f.write(name + '\n')
+    return path
+
+
+def member_args(tool, list_file):
+    """
+    Returns the switches (placed before the archive) and arguments (after it) that make unrar or 7z extract only
+    the members named in `list_file`.
+    """
+    if os.path.basename(tool).lower().startswith('unrar'):
+        return ['-scfl'], ['@' + list_file]
+    # -spd takes the names literally instead of as wildcards
+    return ['-scsUTF-8', '-spd'], ['@' + list_file]
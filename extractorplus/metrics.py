@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import bisect
+import logging
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+
+log = logging.getLogger(__name__)
+
+# Bucket upper bounds, in seconds and bytes per second respectively
+TIME_BUCKETS = [0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600]
+RATE_BUCKETS = [1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9]
+
+
+def _label_str(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for n, v in zip(names, values))
+
+
+class Counter(object):
+    """Monotonic counter, optionally split by label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, doc, labels=()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def inc(self, amount=1, *label_values):
+        key = tuple(label_values)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, _label_str(self.labels, key), value
+
+    def to_dict(self):
+        if not self.labels:
+            return self._values.get((), 0)
+        return {','.join(str(v) for v in key): value for key, value in self._values.items()}
+
+
+class Histogram(object):
+    """Cumulative bucket histogram with a running sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, doc, buckets):
+        self.name = name
+        self.doc = doc
+        self.buckets = list(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self._counts):
+            cumulative += count
+            yield self.name + '_bucket', '{le="%s"}' % bound, cumulative
+        yield self.name + '_sum', '', self.sum
+        yield self.name + '_count', '', self.count
+
+    def to_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ['+Inf'], self._counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class ExtractionMetrics(object):
+    """Counters and histograms describing every extraction job the plugin has run."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.jobs = Counter('extractorplus_jobs_total', 'Extraction jobs by tool and exit code', ('tool', 'exit_code'))
+        self.bytes_in = Counter('extractorplus_bytes_in_total', 'Archive bytes read')
+        self.bytes_out = Counter('extractorplus_bytes_out_total', 'Extracted bytes written')
+        self.queue_wait = Histogram('extractorplus_queue_wait_seconds', 'Time jobs spent queued', TIME_BUCKETS)
+        self.wall_time = Histogram('extractorplus_extract_seconds', 'Extraction wall time', TIME_BUCKETS)
+        self.move_time = Histogram('extractorplus_move_seconds', 'Time spent moving output out of the temp dir',
+                                   TIME_BUCKETS)
+        self.throughput = Histogram('extractorplus_throughput_bytes_per_second', 'Extracted bytes per second',
+                                    RATE_BUCKETS)
+        self._metrics = [self.jobs, self.bytes_in, self.bytes_out, self.queue_wait, self.wall_time, self.move_time,
+                         self.throughput]
+
+    def observe_job(self, tool, exit_code, queue_wait, wall_time, bytes_in, bytes_out, move_time=None):
+        with self._lock:
+            self.jobs.inc(1, tool, exit_code)
+            self.bytes_in.inc(bytes_in)
+            self.bytes_out.inc(bytes_out)
+            self.queue_wait.observe(queue_wait)
+            self.wall_time.observe(wall_time)
+            if move_time is not None:
+                self.move_time.observe(move_time)
+            if wall_time > 0 and exit_code == 0:
+                self.throughput.observe(bytes_out / wall_time)
+
+    def to_dict(self):
+        with self._lock:
+            return {m.name: m.to_dict() for m in self._metrics}
+
+    def render(self, gauges=None):
+        """Renders all metrics, plus any extra {name: value} gauges, in the Prometheus text format."""
+        lines = []
+        with self._lock:
+            for metric in self._metrics:
+                lines.append('# HELP %s %s' % (metric.name, metric.doc))
+                lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+                for name, labels, value in metric.samples():
+                    lines.append('%s%s %s' % (name, labels, value))
+        for name, value in (gauges or {}).items():
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('%s %s' % (name, value))
+        return '\n'.join(lines) + '\n'
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Minimal /metrics endpoint serving `render()` on a background thread."""
+
+    def __init__(self, render, address, port):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                log.debug("Metrics request: " + fmt % args)
+
+        self.httpd = _ThreadingHTTPServer((address, port), Handler)
+        self.thread = Thread(target=self.httpd.serve_forever, name='ExtractorPlus-metrics')
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        log.info("Serving extraction metrics on http://%s:%s/metrics" % self.httpd.server_address[:2])
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
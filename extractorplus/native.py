@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import tarfile
+import zipfile
+
+log = logging.getLogger(__name__)
+
+# Extensions the in-process engine can handle with the standard library alone
+NATIVE_EXTENSIONS = ['.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz', '.tar.xz', '.txz', '.tar.lzma', '.tlz']
+
+COPY_BUFFER = 1024 * 1024
+
+
+class NativeExtractor(object):
+    """
+    In-process extraction of zip and tar family archives using zipfile/tarfile.
+
+    Members are streamed to disk through a large copy buffer, and a failing member is logged and skipped
+    instead of aborting the whole archive.
+    """
+
+    def __init__(self, progress=None, member_filter=None):
+        """
+        Args:
+            progress (callable): Optional callback taking (member_name, bytes_done) after each member
+            member_filter (MemberFilter): Optional filter, only the files it wants are extracted
+        """
+        self.progress = progress
+        self.member_filter = member_filter
+        self.errors = []
+        self.bytes_written = 0
+        self._dirs = set()
+        self._links = False
+        self._cancelled = False
+
+    def cancel(self):
+        """Stops the running extraction before its next member."""
+        self._cancelled = True
+
+    def _check_cancelled(self, archive):
+        if self._cancelled:
+            self.errors.append((archive, 'cancelled'))
+        return self._cancelled
+
+    def extract(self, archive, destination):
+        """
+        Extracts `archive` into `destination`.
+
+        Returns 0 on success and 1 if the archive could not be read or any member failed, mirroring a
+        command line tool's exit code.
+        """
+        self.errors = []
+        self.bytes_written = 0
+        self._dirs = set()
+        self._links = False
+        destination = os.path.realpath(destination)
+        try:
+            if zipfile.is_zipfile(archive):
+                self._extract_zip(archive, destination)
+            else:
+                self._extract_tar(archive, destination)
+        except (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError) as e:
+            log.error("Native extraction of %s failed: %s" % (archive, e))
+            self.errors.append((archive, str(e)))
+        return 1 if self.errors else 0
+
+    def _target(self, destination, name):
+        """Resolves a member name inside destination, refusing anything that would escape it."""
+        target = os.path.normpath(os.path.join(destination, name))
+        if self._links:
+            # Once the archive created links a path may run through them, which only resolving it on disk catches.
+            # Archives without links keep the lexical check and skip an lstat per path component.
+            target = os.path.realpath(target)
+        if os.path.commonpath([destination, target]) != destination:
+            raise ValueError("Member %s would be extracted outside of %s" % (name, destination))
+        return target
+
+    def _write(self, source, target, name):
+        parent = os.path.dirname(target)
+        if parent not in self._dirs:
+            os.makedirs(parent, exist_ok=True)
+            self._dirs.add(parent)
+        with open(target, 'wb') as out:
+            # Reported per chunk, so a single large member does not look like a stalled job
+            while True:
+                chunk = source.read(COPY_BUFFER)
+                if not chunk:
+                    break
+                out.write(chunk)
+                self.bytes_written += len(chunk)
+                if self.progress:
+                    self.progress(name, self.bytes_written)
+
+    def _extract_zip(self, archive, destination):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if self._check_cancelled(archive):
+                    return
+                try:
+                    target = self._target(destination, info.filename)
+                    if info.is_dir():
+                        if not self.member_filter:
+                            os.makedirs(target, exist_ok=True)
+                        continue
+                    if self.member_filter and not self.member_filter.wanted(info.filename, info.file_size):
+                        continue
+                    with zf.open(info) as source:
+                        self._write(source, target, info.filename)
+                    mode = (info.external_attr >> 16) & 0o777
+                    if mode:
+                        os.chmod(target, mode)
+                except (OSError, ValueError, zipfile.BadZipFile) as e:
+                    log.error("Failed to extract %s from %s: %s" % (info.filename, archive, e))
+                    self.errors.append((info.filename, str(e)))
+
+    def _extract_tar(self, archive, destination):
+        # Stream mode reads the archive strictly sequentially, so compressed tarballs are never seeked
+        with tarfile.open(archive, mode='r|*') as tf:
+            for member in tf:
+                if self._check_cancelled(archive):
+                    return
+                try:
+                    target = self._target(destination, member.name)
+                    if self.member_filter and not (member.isfile() and
+                                                   self.member_filter.wanted(member.name, member.size)):
+                        # Directories of wanted files are created along with them
+                        continue
+                    if member.isfile():
+                        source = tf.extractfile(member)
+                        self._write(source, target, member.name)
+                        os.chmod(target, member.mode & 0o777)
+                        os.utime(target, (member.mtime, member.mtime))
+                    elif member.isdir():
+                        os.makedirs(target, exist_ok=True)
+                    elif member.issym() or member.islnk():
+                        # Symlinks resolve relative to the directory they really end up in, hard links relative
+                        # to the root
+                        if member.issym():
+                            link_dir = os.path.realpath(os.path.dirname(os.path.join(destination, member.name)))
+                            self._target(destination, os.path.join(link_dir, member.linkname))
+                        else:
+                            self._target(destination, member.linkname)
+                        if hasattr(tarfile, 'data_filter'):
+                            tf.extract(member, destination, filter='data')
+                        else:
+                            tf.extract(member, destination)
+                        self._links = True
+                    else:
+                        log.debug("Skipping special tar member %s in %s" % (member.name, archive))
+                except (OSError, ValueError, tarfile.TarError) as e:
+                    log.error("Failed to extract %s from %s: %s" % (member.name, archive, e))
+                    self.errors.append((member.name, str(e)))
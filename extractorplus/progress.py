@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import os
+import re
+import time
+from collections import deque
+from threading import Lock
+
+# unrar and 7z -bsp1 both report a bare "NN%" that is redrawn with \r or backspaces
+PERCENT_RE = re.compile(r'(\d{1,3})%')
+# Emitted by tar's --checkpoint-action=echo, see TAR_PROGRESS_ARGS
+CHECKPOINT_RE = re.compile(r'CKPT (\d+)')
+TAR_CHECKPOINT_RECORDS = 100
+TAR_RECORD_SIZE = 10240
+TAR_PROGRESS_ARGS = ['--checkpoint=%d' % TAR_CHECKPOINT_RECORDS, '--checkpoint-action=echo=CKPT %u']
+
+
+class JobProgress(object):
+    """Live progress of one extraction job, as returned by the get_progress RPC."""
+
+    def __init__(self, job_id, name, torrent_id, total=0):
+        self.job_id = job_id
+        self.name = name
+        self.torrent_id = torrent_id
+        self.total = total
+        self.state = 'queued'
+        self.queued_at = time.time()
+        self.started_at = None
+        self.updated_at = None
+        self.finished_at = None
+        self.bytes_done = 0
+        self.percent = None
+        self.exit_code = None
+
+    def start(self):
+        self.state = 'running'
+        self.started_at = self.updated_at = time.time()
+
+    def touch(self):
+        """Records that the job is alive, e.g. because its tool printed something."""
+        self.updated_at = time.time()
+
+    def update(self, bytes_done=None, percent=None):
+        """Records new progress, deriving bytes from percent (or vice versa) when the total is known."""
+        self.updated_at = time.time()
+        if percent is not None:
+            self.percent = min(max(percent, 0), 100)
+            if bytes_done is None and self.total:
+                bytes_done = self.total * self.percent / 100.0
+        if bytes_done is not None:
+            self.bytes_done = bytes_done
+            if percent is None and self.total:
+                self.percent = min(100.0 * bytes_done / self.total, 99.0)
+
+    def finish(self, exit_code, state=None):
+        self.exit_code = exit_code
+        self.finished_at = time.time()
+        self.state = state or ('done' if exit_code == 0 else 'failed')
+        if exit_code == 0:
+            self.percent = 100
+            self.bytes_done = max(self.bytes_done, self.total)
+
+    def rate(self):
+        """Returns the average throughput in bytes per second since the job started."""
+        if not self.started_at:
+            return 0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.bytes_done / elapsed if elapsed > 0 else 0
+
+    def eta(self):
+        """Returns the estimated seconds remaining, or None when it cannot be estimated."""
+        rate = self.rate()
+        if self.state != 'running' or not rate or not self.total:
+            return None
+        return max(self.total - self.bytes_done, 0) / rate
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'name': self.name,
+            'torrent_id': self.torrent_id,
+            'state': self.state,
+            'total': self.total,
+            'bytes_done': int(self.bytes_done),
+            'percent': self.percent,
+            'rate': self.rate(),
+            'eta': self.eta(),
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'updated_at': self.updated_at,
+            'exit_code': self.exit_code,
+        }
+
+
+class ProgressParser(object):
+    """Incrementally parses tool output, feeding whatever progress it finds into a JobProgress."""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self._tail = ''
+
+    def feed(self, data):
+        self.progress.touch()
+        text = self._tail + data.decode('utf-8', 'replace')
+        # Keep a partial line around in case a marker is split across reads
+        cut = max(text.rfind('\n'), text.rfind('\r'), text.rfind('\b'))
+        self._tail = text[cut + 1:][-64:]
+        checkpoints = CHECKPOINT_RE.findall(text)
+        if checkpoints:
+            self.progress.update(bytes_done=int(checkpoints[-1]) * TAR_CHECKPOINT_RECORDS * TAR_RECORD_SIZE)
+            return
+        percents = PERCENT_RE.findall(text)
+        if percents:
+            self.progress.update(percent=int(percents[-1]))
+
+    def drain(self, stream, chunk_size=4096):
+        """Reads `stream` until EOF, so a chatty tool can never stall on a full pipe."""
+        fd = stream.fileno()
+        while True:
+            data = os.read(fd, chunk_size)
+            if not data:
+                break
+            self.feed(data)
+
+
+class ProgressTracker(object):
+    """Thread-safe registry of queued, running and recently finished jobs."""
+
+    def __init__(self, history=20):
+        self._lock = Lock()
+        self._jobs = {}
+        self._finished = deque(maxlen=history)
+
+    def add(self, progress):
+        with self._lock:
+            self._jobs[progress.job_id] = progress
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def finish(self, job_id, exit_code, state=None):
+        with self._lock:
+            progress = self._jobs.pop(job_id, None)
+            if progress is not None:
+                progress.finish(exit_code, state)
+                self._finished.append(progress)
+        return progress
+
+    def snapshot(self):
+        with self._lock:
+            jobs = list(self._jobs.values()) + list(self._finished)
+        return [job.to_dict() for job in jobs]
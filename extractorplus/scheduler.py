@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import heapq
+import itertools
+import logging
+from threading import Condition, Thread, current_thread
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when a batch would push the scheduler past its queue limit."""
+
+
+class Batch(object):
+    """A group of jobs (usually one torrent) that completes when its last job has run."""
+
+    def __init__(self, key, size, on_complete):
+        self.key = key
+        self.remaining = size
+        self.on_complete = on_complete
+        self.results = []
+
+
+class ExtractScheduler(object):
+    """
+    Single dispatcher feeding a fixed set of worker threads from a bounded priority queue.
+
+    Lower priority values run first. Each submitted batch gets a completion callback instead of a thread
+    blocking on its futures, so a burst of finished torrents only costs queue entries.
+
+    Items can also be grouped (e.g. by target device) with a separate concurrency limit per group. A worker
+    skips over items whose group is saturated and takes the best runnable one instead.
+
+    An optional admission check (e.g. for free disk space) can hold items back as well. Held items are retried
+    whenever a running item finishes, and every `hold_retry` seconds in case resources were freed elsewhere.
+    Once the scheduler is shut down, items that are still held are dropped rather than waited for.
+    """
+
+    def __init__(self, run, max_workers=2, max_queue=10000, group=None, group_limit=None, admit=None,
+                 release=None, hold_retry=30):
+        """
+        Args:
+            run (callable): Called on a worker thread with each queued item, its return value is collected
+            max_workers (int): Number of worker threads
+            max_queue (int): Maximum number of queued items
+            group (callable): Returns the group key of an item, evaluated once at submit time
+            group_limit (callable): Returns the concurrency limit for a group key, 0 for unlimited
+            admit (callable): Returns False if an item cannot start yet, called before it is handed to a worker
+            release (callable): Called with each admitted item once it has run
+            hold_retry (float): Seconds between admission retries while items are held back
+        """
+        self.run = run
+        self.max_queue = max_queue
+        self.group = group or (lambda item: None)
+        self.group_limit = group_limit or (lambda key: 0)
+        self.admit = admit or (lambda item: True)
+        self.release = release or (lambda item: None)
+        self.hold_retry = hold_retry
+        self._held = False
+        self._group_active = {}
+        self._max_workers = 0
+        self._workers = []
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = Condition()
+        self._shutdown = False
+        self.active = 0
+        self.set_max_workers(max_workers)
+
+    def submit(self, key, items, priority, on_complete=None):
+        """
+        Queues `items` as one batch. `on_complete(batch)` runs on a worker thread after the last item.
+
+        Raises QueueFull if the batch does not fit, rather than blocking the caller.
+        """
+        items = list(items)
+        batch = Batch(key, len(items), on_complete)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Scheduler has been shut down")
+            if len(self._heap) + len(items) > self.max_queue:
+                raise QueueFull("Extraction queue is full (%s queued)" % len(self._heap))
+            for item in items:
+                heapq.heappush(self._heap, (priority, next(self._seq), item, batch, self.group(item)))
+            self._cond.notify(len(items))
+        if not items and on_complete:
+            on_complete(batch)
+        return batch
+
+    def queued(self):
+        """Returns the number of items waiting for a worker."""
+        with self._cond:
+            return len(self._heap)
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_max_workers(self, count):
+        """Grows or shrinks the worker set, surplus workers exit after their current item."""
+        count = max(1, int(count))
+        with self._cond:
+            self._max_workers = count
+            self._workers = [w for w in self._workers if w.is_alive()]
+            while len(self._workers) < count:
+                worker = Thread(target=self._work, name='ExtractorPlus-worker')
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+            self._cond.notify_all()
+
+    def _next(self):
+        """Waits for the next item, returning None when this worker should exit."""
+        with self._cond:
+            while True:
+                if self._shutdown and not self._heap:
+                    return None
+                if len(self._workers) > self._max_workers:
+                    # The pool was shrunk, so retire this worker
+                    self._workers.remove(current_thread())
+                    return None
+                entry = self._pop_runnable()
+                if entry is not None:
+                    self.active += 1
+                    self._group_active[entry[4]] = self._group_active.get(entry[4], 0) + 1
+                    return entry
+                if self._shutdown and not self._heap:
+                    # Whatever was left was held and has been dropped
+                    return None
+                self._cond.wait(self.hold_retry if self._held else None)
+
+    def _pop_runnable(self):
+        """Pops the highest priority entry that has a free group slot and is admitted, leaving the others queued."""
+        skipped = []
+        entry = None
+        self._held = False
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            limit = self.group_limit(candidate[4])
+            if not limit or self._group_active.get(candidate[4], 0) < limit:
+                if self.admit(candidate[2]):
+                    entry = candidate
+                    break
+                if self._shutdown:
+                    # Held items may wait for resources indefinitely, so they are dropped instead of blocking
+                    # the shutdown
+                    log.info("Dropping held item %s on shutdown" % (candidate[2],))
+                    continue
+                self._held = True
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self._heap, candidate)
+        return entry
+
+    def group_usage(self):
+        """Returns a dict of group key -> running item count."""
+        with self._cond:
+            return {k: v for k, v in self._group_active.items() if v}
+
+    def _work(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            _, _, item, batch, group = entry
+            result = None
+            try:
+                result = self.run(item)
+            except Exception as e:
+                log.exception("Extraction job failed: %s" % e)
+            finally:
+                with self._cond:
+                    self.release(item)
+                    self.active -= 1
+                    self._group_active[group] -= 1
+                    batch.results.append(result)
+                    batch.remaining -= 1
+                    done = batch.remaining == 0
+                    # A freed group slot may unblock a worker that is waiting on a different group
+                    self._cond.notify_all()
+            if done and batch.on_complete:
+                try:
+                    batch.on_complete(batch)
+                except Exception as e:
+                    log.exception("Batch completion callback failed for %s: %s" % (batch.key, e))
+
+    def shutdown(self, wait=True):
+        """Stops accepting work, lets queued items drain (dropping held ones) and optionally waits for the workers."""
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+
+log = logging.getLogger(__name__)
+
+# Enough to reach the "ustar" magic of a tar header at offset 257
+SNIFF_SIZE = 512
+
+# Extensions worth opening at all, everything else (video, nfo, ...) is skipped without a read
+SNIFF_EXTENSIONS = {
+    '.rar', '.r00', '.zip', '.7z', '.001', '.cbz', '.cbr', '.cb7', '.cbt', '.zst', '.tzst',
+    '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz', '.tar.xz', '.txz', '.tar.lzma', '.tlz', '.tar.zst',
+}
+
+# Compressed stream magic -> suffix of the matching tarball kind
+COMPRESSED_MAGIC = [
+    (b'\x1f\x8b', '.gz'),
+    (b'BZh', '.bz2'),
+    (b'\xfd7zXZ\x00', '.xz'),
+    (b'\x28\xb5\x2f\xfd', '.zst'),
+    (b'\x5d\x00\x00', '.lzma'),
+]
+TAR_NAMES = ('.tar.', '.tgz', '.tbz', '.txz', '.tlz', '.tzst')
+
+
+def sniff_bytes(header, name=''):
+    """
+    Returns the archive kind for the leading bytes of a file, as the extension the command tables use
+    (e.g. '.rar', '.tar.gz'), or None if it is not an archive we handle.
+
+    Compressed streams cannot be told apart from compressed tarballs without decompressing, so `name`
+    decides between the two; a bare compressed stream is only handled for zstd.
+    """
+    if header.startswith(b'Rar!\x1a\x07'):
+        return '.rar'
+    if header.startswith(b'7z\xbc\xaf\x27\x1c'):
+        return '.7z'
+    # Local file header, or the marker of an empty archive. Spanned zips start with PK\x07\x08 in their
+    # first volume but have to be opened through the last one, so that marker is not matched here.
+    if header.startswith(b'PK\x03\x04') or header.startswith(b'PK\x05\x06'):
+        return '.zip'
+    if header[257:262] == b'ustar':
+        return '.tar'
+    for magic, suffix in COMPRESSED_MAGIC:
+        if header.startswith(magic):
+            if any(marker in name.lower() for marker in TAR_NAMES):
+                return '.tar' + suffix
+            return '.zst' if suffix == '.zst' else None
+    return None
+
+
+class ArchiveSniffer(object):
+    """
+    Identifies archives by their magic bytes instead of trusting the file name.
+
+    Each candidate costs one stat and, unless the (size, mtime) pair is already cached, one small read.
+    """
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def kind(self, path, ext):
+        """
+        Returns the archive kind of `path`, or None. `ext` is its (possibly compound) extension, which
+        decides whether the file is worth looking at.
+        """
+        if ext.lower() not in SNIFF_EXTENSIONS:
+            return None
+        path = str(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_size, st.st_mtime)
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and cached[0] == key:
+                self._cache.move_to_end(path)
+                return cached[1]
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(SNIFF_SIZE)
+        except OSError as e:
+            log.debug("Could not sniff %s: %s" % (path, e))
+            return None
+        kind = sniff_bytes(header, os.path.basename(path))
+        if kind is not None and kind != ext.lower():
+            log.debug("%s looks like %s rather than %s" % (path, kind, ext))
+        with self._lock:
+            self._cache[path] = (key, kind)
+            self._cache.move_to_end(path)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return kind
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import shutil
+import time
+from threading import Lock
+
+from extractorplus.fileops import existing_parent
+
+log = logging.getLogger(__name__)
+
+# Seconds a device's free space is reused for, so one scheduling pass over many held jobs stats it only once
+FREE_SPACE_TTL = 2
+
+
+def free_bytes(path):
+    """Returns the bytes available to unprivileged users on the filesystem holding `path`, or None."""
+    try:
+        return shutil.disk_usage(existing_parent(path)).free
+    except OSError as e:
+        log.debug("Could not read free space of %s: %s" % (path, e))
+        return None
+
+
+def total_bytes(path):
+    """Returns the size of the filesystem holding `path`, or None."""
+    try:
+        return shutil.disk_usage(existing_parent(path)).total
+    except OSError as e:
+        log.debug("Could not read the size of %s: %s" % (path, e))
+        return None
+
+
+class SpaceReservations(object):
+    """
+    Admission control for disk space.
+
+    A job states how many bytes it needs on each device, and is only admitted if every device still has that
+    much free after subtracting what running jobs have reserved and a safety margin. Reservations are held
+    until the job finishes, so several queued jobs never count on the same free space.
+
+    A need that is only a guess (no listing gave the extracted size) is a soft one: it holds a job while other
+    jobs hold reservations on the device, but with nothing else running there is nothing to wait for and the
+    job is admitted regardless.
+    """
+
+    def __init__(self, margin=0):
+        self.margin = margin
+        self._lock = Lock()
+        self._reserved = {}
+        self._jobs = {}
+        self._free = {}
+
+    def admit(self, job_id, needs, guessed=False):
+        """
+        Reserves space for a job if it fits, returning False (and reserving nothing) otherwise.
+
+        Args:
+            job_id (str): Key to release the reservation with
+            needs (dict): device -> (path on that device, bytes needed)
+            guessed (bool): The needs are estimates rather than read from the archive's listing
+        """
+        with self._lock:
+            for device, (path, size) in needs.items():
+                reserved = self._reserved.get(device, 0)
+                free = self._cached_free(device, path)
+                if free is not None and free - reserved - self.margin < size and (reserved or not guessed):
+                    return False
+            for device, (_, size) in needs.items():
+                self._reserved[device] = self._reserved.get(device, 0) + size
+            self._jobs[job_id] = {device: size for device, (_, size) in needs.items()}
+            return True
+
+    def _cached_free(self, device, path):
+        now = time.monotonic()
+        cached = self._free.get(device)
+        if cached is None or now - cached[0] > FREE_SPACE_TTL:
+            cached = self._free[device] = (now, free_bytes(path))
+        return cached[1]
+
+    def too_large(self, needs):
+        """Returns the path of the first device that is smaller than what the job needs on it, or None."""
+        for device, (path, size) in needs.items():
+            total = total_bytes(path)
+            if total is not None and size > total:
+                return path
+        return None
+
+    def release(self, job_id):
+        with self._lock:
+            for device, size in self._jobs.pop(job_id, {}).items():
+                self._reserved[device] -= size
+                if not self._reserved[device]:
+                    del self._reserved[device]
+
+    def reserved(self):
+        """Returns device -> reserved bytes."""
+        with self._lock:
+            return dict(self._reserved)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+from threading import Lock
+
+from extractorplus.volumes import volume_key
+
+
+def completed_files(files, file_progress):
+    """
+    Returns the files of every archive set that is fully downloaded, so a set is never started while one of its
+    volumes is still missing.
+
+    Args:
+        files (list): Deluge file dicts with 'index' and 'path'
+        file_progress (list): Per-file progress (0.0 - 1.0) indexed like the torrent's files
+    """
+    def set_key(path):
+        key = volume_key(path)
+        return ('single', path) if key is None else key[:2]
+
+    def done(f):
+        index = f['index']
+        return index < len(file_progress) and file_progress[index] >= 1.0
+
+    incomplete = {set_key(f['path']) for f in files if not done(f)}
+    return [f for f in files if set_key(f['path']) not in incomplete]
+
+
+class StreamingTracker(object):
+    """
+    Keeps track of the archive sets of each torrent that were queued outside of its finished batch, either while
+    it was still downloading or as nested archives found in extracted output. Finishing the torrent then
+    neither queues them again nor marks it finished before they are extracted.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._torrents = {}
+
+    def claim(self, torrent_id, paths, early=True):
+        """
+        Marks archive sets (by first volume path) as queued and returns the ones that were not already.
+
+        `early` claims are submitted as a batch of their own, which has to be reported with batch_done() once it
+        has run.
+        """
+        with self._lock:
+            entry = self._torrents.setdefault(torrent_id, {'paths': set(), 'batches': 0, 'finish': None})
+            new = [path for path in paths if path not in entry['paths']]
+            entry['paths'].update(new)
+            if early and new:
+                entry['batches'] += 1
+            return new
+
+    def batch_done(self, torrent_id):
+        """Reports an early batch as done, returning the waiting finish callback once the last one is."""
+        with self._lock:
+            entry = self._torrents.get(torrent_id)
+            if entry is None:
+                return None
+            entry['batches'] -= 1
+            if entry['batches'] > 0 or entry['finish'] is None:
+                return None
+            del self._torrents[torrent_id]
+            return entry['finish']
+
+    def wait(self, torrent_id, callback):
+        """
+        Defers a finished torrent's completion until its early batches are done. Returns True if `callback`
+        will be called later, False if nothing is running and the torrent can be finished now.
+        """
+        with self._lock:
+            entry = self._torrents.get(torrent_id)
+            if entry is None or entry['batches'] <= 0:
+                self._torrents.pop(torrent_id, None)
+                return False
+            entry['finish'] = callback
+            return True
+
+    def forget(self, torrent_id):
+        with self._lock:
+            self._torrents.pop(torrent_id, None)
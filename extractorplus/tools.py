@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import re
+import subprocess
+from shutil import which
+from threading import Lock
+
+import pkg_resources
+from deluge.common import windows_check
+
+log = logging.getLogger(__name__)
+
+VERSION_RE = re.compile(r'(\d+\.\d+(?:\.\d+)?)')
+
+# Bumped whenever the feature checks change, so cached probe results made with the old ones are redone
+PROBE_VERSION = 2
+
+# The help texts list switches in a condensed form (7z: -bs{o|e|p}{0|1|2}, unrar: mt<threads>), so these
+# features are told by the version that introduced them
+SEVEN_ZIP_FEATURES = {'multithread': '-mmt', 'progress': lambda version: version >= (15, 9)}
+
+# name -> (arguments printing the version banner, {feature: text in the probe output, or a check of the version})
+LINUX_TOOLS = {
+    'unrar': ([], {'multithread': lambda version: version >= (5, 0)}),
+    'unzip': (['-v'], {}),
+    'tar': (['--version'], {'gnu': 'GNU tar'}),
+    '7zr': ([], SEVEN_ZIP_FEATURES),
+    '7z': ([], SEVEN_ZIP_FEATURES),
+    '7za': ([], SEVEN_ZIP_FEATURES),
+    'pigz': (['--version'], {}),
+    'pbzip2': (['-V'], {}),
+    'lbzip2': (['-V'], {}),
+    'pixz': (['-h'], {}),
+    # xz accepts -T since 5.2 but only decompresses in parallel from 5.4
+    'xz': (['--version'], {'multithread': lambda version: version >= (5, 4)}),
+    'zstd': (['--help'], {'multithread': '-T#'}),
+}
+
+TAR_EXTENSIONS = ['.tar.bz2', '.tbz', '.tar.xz', '.txz', '.tar.gz', '.tgz', '.tar.lzma', '.tlz']
+
+# Multi-threaded decompressors writing the tar stream to stdout, in order of preference. The archive path is
+# appended to the command and {threads} is replaced with the job's thread budget.
+_GZ = [('pigz', None, ['pigz', '-dc', '-p', '{threads}'])]
+_BZ2 = [('lbzip2', None, ['lbzip2', '-dc', '-n', '{threads}']),
+        ('pbzip2', None, ['pbzip2', '-dc', '-p{threads}'])]
+_XZ = [('xz', 'multithread', ['xz', '-dc', '-T', '{threads}']),
+       ('pixz', None, ['pixz', '-d', '-p', '{threads}', '-i'])]
+_ZST = [('zstd', None, ['zstd', '-dc', '-T{threads}'])]
+PARALLEL_DECOMPRESSORS = {
+    '.tar.gz': _GZ, '.tgz': _GZ,
+    '.tar.bz2': _BZ2, '.tbz': _BZ2,
+    '.tar.xz': _XZ, '.txz': _XZ,
+    '.tar.zst': _ZST, '.tzst': _ZST,
+}
+
+
+def windows_7z_candidates():
+    return [
+        pkg_resources.resource_filename(__name__, "7z.exe"),
+        '7z.exe',
+        'C:\\Program Files\\7-Zip\\7z.exe',
+        'C:\\Program Files (x86)\\7-Zip\\7z.exe'
+    ]
+
+
+class ToolRegistry(object):
+    """
+    Lazily discovers the extraction binaries and what they support.
+
+    Probe results are persisted along with each binary's path and mtime, so later startups only stat the
+    binaries and re-run a tool only when it was upgraded, moved or newly installed.
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self._lock = Lock()
+        self._tools = None
+        self._commands = None
+
+    @property
+    def tools(self):
+        """Returns {name: {'path', 'mtime', 'version', 'features'}} for every binary found."""
+        with self._lock:
+            if self._tools is None:
+                self._tools = self._probe_all(self._load_cache())
+                self._save_cache()
+            return self._tools
+
+    def refresh(self):
+        """Discards every cached result and probes all tools again."""
+        with self._lock:
+            self._tools = self._probe_all({})
+            self._commands = None
+            self._save_cache()
+        return self.tools
+
+    def has(self, name, feature=None):
+        tool = self.tools.get(name)
+        if tool is None:
+            return False
+        return feature is None or feature in tool['features']
+
+    def _candidates(self):
+        if windows_check():
+            return {path: ([], SEVEN_ZIP_FEATURES) for path in windows_7z_candidates()}
+        return LINUX_TOOLS
+
+    def _probe_all(self, cached):
+        tools = {}
+        for name, (args, features) in self._candidates().items():
+            path = which(name)
+            if not path:
+                continue
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            entry = cached.get(name)
+            if entry and entry.get('path') == path and entry.get('mtime') == mtime \
+                    and entry.get('probe') == PROBE_VERSION:
+                tools[name] = entry
+                continue
+            tools[name] = self._probe(name, path, mtime, args, features)
+        return tools
+
+    @staticmethod
+    def _probe(name, path, mtime, args, features):
+        log.debug("Probing %s (%s)" % (name, path))
+        try:
+            ps = subprocess.run([path] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                stdin=subprocess.DEVNULL, timeout=10)
+            output = ps.stdout.decode('utf-8', 'replace')
+        except (OSError, subprocess.SubprocessError) as e:
+            log.warning("Could not probe %s: %s" % (path, e))
+            output = ''
+        version = VERSION_RE.search(output)
+        version = version.group(1) if version else None
+        version_tuple = tuple(int(v) for v in version.split('.')) if version else ()
+        found = []
+        for feature, marker in features.items():
+            if callable(marker) and marker(version_tuple) or not callable(marker) and marker in output:
+                found.append(feature)
+        return {
+            'path': path,
+            'mtime': mtime,
+            'version': version,
+            'features': sorted(found),
+            'probe': PROBE_VERSION,
+        }
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            log.debug("Ignoring unreadable tool cache %s: %s" % (self.cache_path, e))
+            return {}
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, 'w') as f:
+                json.dump(self._tools, f, indent=2)
+        except OSError as e:
+            log.warning("Could not save tool cache %s: %s" % (self.cache_path, e))
+
+    def commands(self):
+        """Returns (EXTRACT_COMMANDS, EXTRA_COMMANDS) for the tools that were found."""
+        tools = self.tools
+        with self._lock:
+            if self._commands is None:
+                self._commands = self._build_commands(tools)
+                if not self._commands[0]:
+                    log.warning('No archive extracting programs found, only the native zip/tar engine is available.')
+            return self._commands
+
+    @staticmethod
+    def _build_commands(tools):
+        extract_commands = {}
+        extra_commands = {}
+        if windows_check():
+            for win_7z_exe in windows_7z_candidates():
+                if win_7z_exe in tools:
+                    log.debug("Found 7z: %s" % win_7z_exe)
+                    l1_cmds = [win_7z_exe, 'x', '-y', '-aoa', '-bsp1']
+                    l1t_cmds = [win_7z_exe, 'x', '-y', '-so', '-aoa', '-bsp2']
+                    l2_cmds = [win_7z_exe, 'x', '-y', '-ttar', '-si', '-aoa']
+                    ext_7z = ['.r00', '.rar', '.zip', '.tar', '.7z', '.xz', '.lzma']
+                    # 7-zip on windows cannot extract tar.* with single command, so we do some pipe magic to one-shot it
+                    extract_commands = {**dict.fromkeys(ext_7z, l1_cmds), **dict.fromkeys(TAR_EXTENSIONS, l1t_cmds)}
+                    extra_commands = dict.fromkeys(TAR_EXTENSIONS, l2_cmds)
+                    break
+            return extract_commands, extra_commands
+
+        if 'unrar' in tools:
+            extract_commands['.rar'] = ['unrar', 'x', '-o+', '-y']
+            extract_commands['.r00'] = ['unrar', 'x', '-o+', '-y']
+        if 'unzip' in tools:
+            extract_commands['.zip'] = ['unzip']
+        if 'tar' in tools:
+            extract_commands.update({
+                '.tar': ['tar', '-xf'],
+                '.tar.gz': ['tar', '-xzf'],
+                '.tgz': ['tar', '-xzf'],
+                '.tar.bz2': ['tar', '-xjf'],
+                '.tbz': ['tar', '-xjf'],
+                '.tar.lzma': ['tar', '--lzma', '-xf'],
+                '.tlz': ['tar', '--lzma', '-xf'],
+                '.tar.xz': ['tar', '-xJf'],
+                '.txz': ['tar', '-xJf'],
+            })
+            if 'zstd' in tools:
+                # Used when the zstd pipeline is not, see decompressor(); tar runs zstd itself
+                extract_commands['.tar.zst'] = ['tar', '--zstd', '-xf']
+                extract_commands['.tzst'] = ['tar', '--zstd', '-xf']
+        if 'zstd' in tools:
+            # A bare .zst holds a single file, written next to the others in the extraction directory
+            extract_commands['.zst'] = ['zstd', '-d', '-f', '--output-dir-flat', '.']
+        for seven_zip in ('7zr', '7z', '7za'):
+            if seven_zip in tools:
+                command = [seven_zip, 'x']
+                if 'progress' in tools[seven_zip]['features']:
+                    command.append('-bsp1')
+                extract_commands['.7z'] = command
+                break
+        for name in ('unrar', 'unzip', 'tar'):
+            if name not in tools:
+                log.warning('%s not found, disabling support for its formats' % name)
+        return extract_commands, extra_commands
+
+    def decompressor(self, ext, threads):
+        """
+        Returns a command decompressing a compressed tarball to stdout with `threads` threads, or None if no
+        parallel decompressor for `ext` is installed (or this is Windows, where 7z handles the pipe).
+        """
+        if windows_check():
+            return None
+        for name, feature, template in PARALLEL_DECOMPRESSORS.get(ext, []):
+            if self.has(name, feature):
+                return [arg.replace('{threads}', str(threads)) for arg in template]
+        return None
+
+    def summary(self):
+        """Returns the probe results in an RPC friendly form."""
+        return {name: dict(info) for name, info in self.tools.items()}
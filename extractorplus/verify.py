@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import logging
+import mmap
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+log = logging.getLogger(__name__)
+
+# zlib releases the GIL while hashing, so large chunks let several files be checked in parallel
+CRC_CHUNK = 16 * 1024 * 1024
+
+
+class VerifyStopped(Exception):
+    """Raised inside a CRC worker once another file failed or the job was cancelled."""
+
+
+def parse_sfv(path):
+    """
+    Reads an SFV file into a dict of lowercase file name -> CRC32. Comment lines start with ';'.
+    """
+    checksums = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith(';'):
+                continue
+            name, _, crc = line.rpartition(' ')
+            try:
+                checksums[os.path.basename(name.strip().replace('\\', '/')).lower()] = int(crc, 16)
+            except ValueError:
+                log.debug("Ignoring malformed SFV line in %s: %s" % (path, line))
+    return checksums
+
+
+def sfv_checksums(paths):
+    """
+    Returns file path -> expected CRC32 for the given volumes, from the SFV files in their directories.
+    Volumes no SFV lists are left out.
+    """
+    wanted = {os.path.basename(path).lower(): path for path in paths}
+    expected = {}
+    for directory in {os.path.dirname(path) for path in paths}:
+        try:
+            names = [name for name in os.listdir(directory or '.') if name.lower().endswith('.sfv')]
+        except OSError:
+            continue
+        for name in names:
+            try:
+                checksums = parse_sfv(os.path.join(directory, name))
+            except OSError as e:
+                log.warning("Could not read %s: %s" % (name, e))
+                continue
+            for volume, crc in checksums.items():
+                if volume in wanted:
+                    expected[wanted[volume]] = crc
+    return expected
+
+
+def crc32_file(path, stop=None):
+    """
+    Returns the CRC32 of a file, read through a memory map where possible and large buffered reads otherwise.
+    `stop` is checked between chunks and aborts with VerifyStopped once it returns True.
+    """
+    crc = 0
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return crc
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            mapped = None
+        if mapped is not None:
+            with mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mapped)
+                try:
+                    for offset in range(0, size, CRC_CHUNK):
+                        if stop and stop():
+                            raise VerifyStopped()
+                        crc = zlib.crc32(view[offset:offset + CRC_CHUNK], crc)
+                finally:
+                    view.release()
+            return crc
+        buffer = bytearray(CRC_CHUNK)
+        chunk = memoryview(buffer)
+        while True:
+            if stop and stop():
+                raise VerifyStopped()
+            read = f.readinto(buffer)
+            if not read:
+                return crc
+            crc = zlib.crc32(chunk[:read], crc)
+
+
+def verify_checksums(expected, workers=2, cancelled=None):
+    """
+    Checks files against their expected CRC32 on `workers` threads, stopping as soon as one does not match.
+
+    Args:
+        expected (dict): File path -> CRC32
+        workers (int): Number of files hashed at once
+        cancelled (callable): Returns True once the verification should be abandoned
+
+    Returns:
+        tuple: (path, reason) of the first bad file, or None if all of them match (or it was cancelled)
+    """
+    failed = Event()
+
+    def stop():
+        return failed.is_set() or bool(cancelled and cancelled())
+
+    def check(path):
+        try:
+            actual = crc32_file(path, stop)
+        except VerifyStopped:
+            return None
+        except OSError as e:
+            failed.set()
+            return path, str(e)
+        if actual != expected[path]:
+            failed.set()
+            return path, 'CRC %08X, expected %08X' % (actual, expected[path])
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(expected))),
+                            thread_name_prefix='ExtractorPlus-verify') as pool:
+        for result in pool.map(check, sorted(expected)):
+            if result is not None:
+                return result
+    return None
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019-2022 Digitalhigh <donate.to.digitalhigh@gmail.com>
+#
+# This file is part of the Extractor Plus plugin and is licensed under GNU General Public License 3.0, or later, with
+# the additional special exception to link portions of this program with the OpenSSL library.
+# See LICENSE for more details.
+#
+
+from __future__ import unicode_literals
+
+import os
+import re
+
+# Each pattern captures the set's stem and the volume number, checked in order
+RAR_PART_RE = re.compile(r'^(?P<stem>.+)\.part(?P<num>\d+)\.rar$', re.IGNORECASE)
+RAR_OLD_RE = re.compile(r'^(?P<stem>.+)\.(?:rar|r(?P<num>\d{2,3}))$', re.IGNORECASE)
+SPLIT_RE = re.compile(r'^(?P<stem>.+)\.(?P<num>\d{3})$')
+ZIP_SPAN_RE = re.compile(r'^(?P<stem>.+)\.(?:zip|z(?P<num>\d{2,3}))$', re.IGNORECASE)
+
+
+class VolumeSet(object):
+    """One archive made of one or more files, extracted by opening `first`."""
+
+    def __init__(self, style, stem):
+        self.style = style
+        self.stem = stem
+        self.volumes = []
+        self.size = 0
+
+    def add(self, number, path, size):
+        self.volumes.append((number, path))
+        self.size += size
+
+    @property
+    def first(self):
+        return min(self.volumes)[1]
+
+    @property
+    def paths(self):
+        return [path for _, path in sorted(self.volumes)]
+
+    @property
+    def name(self):
+        """The archive's name without volume numbers or archive extension."""
+        base = os.path.basename(self.stem)
+        if self.style == 'single' or self.style == 'split' and base.lower().endswith(('.7z', '.zip', '.rar')):
+            return os.path.splitext(base)[0]
+        return base
+
+    @property
+    def multi_volume(self):
+        return len(self.volumes) > 1
+
+    def __repr__(self):
+        return '<VolumeSet %s (%s) %s volumes, %s bytes>' % (self.first, self.style, len(self.volumes), self.size)
+
+
+def volume_key(path):
+    """
+    Returns (style, stem, number) for a file that may belong to a volume set, or None for a standalone file.
+
+    The number orders the volumes, the lowest one present is the file the extractor has to be pointed at.
+    """
+    match = RAR_PART_RE.match(path)
+    if match:
+        return 'rar-part', match.group('stem'), int(match.group('num'))
+    match = RAR_OLD_RE.match(path)
+    if match:
+        # name.rar comes first, then name.r00, name.r01, ...
+        num = match.group('num')
+        return 'rar', match.group('stem'), 0 if num is None else int(num) + 1
+    match = SPLIT_RE.match(path)
+    if match:
+        return 'split', match.group('stem'), int(match.group('num'))
+    match = ZIP_SPAN_RE.match(path)
+    if match:
+        # Spanned zips are opened through the .zip, which holds the central directory
+        num = match.group('num')
+        return 'zip', match.group('stem'), -1 if num is None else int(num)
+    return None
+
+
+def resolve_sets(files):
+    """
+    Groups a torrent's files into archive sets in a single pass.
+
+    Args:
+        files (list): Deluge file dicts with at least 'path' and 'size'
+
+    Returns:
+        list: VolumeSet objects in the order their first file appears; files that are not part of a volume
+        naming scheme become single-volume sets
+    """
+    sets = {}
+    order = []
+    for f in files:
+        key = volume_key(f['path'])
+        if key is None:
+            style, stem, number = 'single', f['path'], 0
+        else:
+            style, stem, number = key
+        index_key = (style, stem)
+        vset = sets.get(index_key)
+        if vset is None:
+            vset = sets[index_key] = VolumeSet(style, stem)
+            order.append(vset)
+        vset.add(number, f['path'], f.get('size', 0))
+    return order